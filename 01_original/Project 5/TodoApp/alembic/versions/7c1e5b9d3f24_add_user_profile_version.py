@@ -0,0 +1,27 @@
+"""add user profile version
+
+Revision ID: 7c1e5b9d3f24
+Revises: f3b5d8a1c6e9
+Create Date: 2026-10-17 23:48:05.216734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e5b9d3f24'
+down_revision: Union[str, None] = 'f3b5d8a1c6e9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('profile_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('profile_version')
@@ -0,0 +1,45 @@
+"""add owner priority index to todos
+
+Revision ID: 9b1f4c7e3a20
+Revises: 5c3e8a9d2b71
+Create Date: 2026-10-17 18:41:37.902154
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b1f4c7e3a20'
+down_revision: Union[str, None] = '5c3e8a9d2b71'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    'ix_todos_owner_id_priority_id': ['owner_id', 'priority', 'id'],
+}
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+        with op.get_context().autocommit_block():
+            for name, columns in INDEXES.items():
+                op.create_index(name, 'todos', columns, postgresql_concurrently=True, if_not_exists=True)
+    else:
+        with op.batch_alter_table('todos') as batch_op:
+            for name, columns in INDEXES.items():
+                batch_op.create_index(name, columns)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name in INDEXES:
+                op.drop_index(name, table_name='todos', postgresql_concurrently=True, if_exists=True)
+    else:
+        with op.batch_alter_table('todos') as batch_op:
+            for name in INDEXES:
+                batch_op.drop_index(name)
@@ -0,0 +1,87 @@
+"""add todo stats counters
+
+Revision ID: a8c3e6f2d417
+Revises: 7c1e5b9d3f24
+Create Date: 2026-10-18 00:26:15.093641
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8c3e6f2d417'
+down_revision: Union[str, None] = '7c1e5b9d3f24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SQLITE_ADD = "INSERT INTO todo_stats (owner_id, complete, priority, count) " \
+             "VALUES (coalesce(new.owner_id, 0), coalesce(new.complete, 0), coalesce(new.priority, 0), 1) " \
+             "ON CONFLICT (owner_id, complete, priority) DO UPDATE SET count = count + 1;"
+SQLITE_REMOVE = "UPDATE todo_stats SET count = count - 1 WHERE owner_id = coalesce(old.owner_id, 0) " \
+                "AND complete = coalesce(old.complete, 0) AND priority = coalesce(old.priority, 0);"
+SQLITE_TRIGGERS = {
+    'todo_stats_ai': f"CREATE TRIGGER todo_stats_ai AFTER INSERT ON todos BEGIN {SQLITE_ADD} END",
+    'todo_stats_ad': f"CREATE TRIGGER todo_stats_ad AFTER DELETE ON todos BEGIN {SQLITE_REMOVE} END",
+    'todo_stats_au': "CREATE TRIGGER todo_stats_au AFTER UPDATE OF owner_id, complete, priority "
+                     f"ON todos BEGIN {SQLITE_REMOVE} {SQLITE_ADD} END",
+}
+POSTGRES_FUNCTION = (
+    "CREATE OR REPLACE FUNCTION todo_stats_apply() RETURNS trigger AS $$ BEGIN "
+    "IF TG_OP IN ('UPDATE', 'DELETE') THEN "
+    "UPDATE todo_stats SET count = count - 1 WHERE owner_id = coalesce(OLD.owner_id, 0) "
+    "AND complete = coalesce(OLD.complete, false) AND priority = coalesce(OLD.priority, 0); "
+    "END IF; "
+    "IF TG_OP IN ('INSERT', 'UPDATE') THEN "
+    "INSERT INTO todo_stats (owner_id, complete, priority, count) "
+    "VALUES (coalesce(NEW.owner_id, 0), coalesce(NEW.complete, false), coalesce(NEW.priority, 0), 1) "
+    "ON CONFLICT (owner_id, complete, priority) DO UPDATE SET count = todo_stats.count + 1; "
+    "END IF; "
+    "RETURN NULL; END $$ LANGUAGE plpgsql"
+)
+MYSQL_ADD = "INSERT INTO todo_stats (owner_id, complete, priority, count) " \
+            "VALUES (coalesce(NEW.owner_id, 0), coalesce(NEW.complete, false), coalesce(NEW.priority, 0), 1) " \
+            "ON DUPLICATE KEY UPDATE count = count + 1;"
+MYSQL_REMOVE = "UPDATE todo_stats SET count = count - 1 WHERE owner_id = coalesce(OLD.owner_id, 0) " \
+               "AND complete = coalesce(OLD.complete, false) AND priority = coalesce(OLD.priority, 0);"
+MYSQL_TRIGGERS = {
+    'todo_stats_ai': f"CREATE TRIGGER todo_stats_ai AFTER INSERT ON todos FOR EACH ROW BEGIN {MYSQL_ADD} END",
+    'todo_stats_ad': f"CREATE TRIGGER todo_stats_ad AFTER DELETE ON todos FOR EACH ROW BEGIN {MYSQL_REMOVE} END",
+    'todo_stats_au': "CREATE TRIGGER todo_stats_au AFTER UPDATE ON todos FOR EACH ROW BEGIN "
+                     "IF NOT (OLD.owner_id <=> NEW.owner_id AND OLD.complete <=> NEW.complete "
+                     f"AND OLD.priority <=> NEW.priority) THEN {MYSQL_REMOVE} {MYSQL_ADD} END IF; END",
+}
+
+
+def upgrade() -> None:
+    op.create_table('todo_stats',
+                    sa.Column('owner_id', sa.Integer(), primary_key=True),
+                    sa.Column('complete', sa.Boolean(), primary_key=True),
+                    sa.Column('priority', sa.Integer(), primary_key=True),
+                    sa.Column('count', sa.Integer(), nullable=False))
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute(POSTGRES_FUNCTION)
+        op.execute("CREATE TRIGGER todo_stats_changed AFTER INSERT OR DELETE OR UPDATE OF owner_id, complete, "
+                   "priority ON todos FOR EACH ROW EXECUTE FUNCTION todo_stats_apply()")
+    elif dialect == 'mysql':
+        for statement in MYSQL_TRIGGERS.values():
+            op.execute(statement)
+    elif dialect == 'sqlite':
+        for statement in SQLITE_TRIGGERS.values():
+            op.execute(statement)
+    op.execute("INSERT INTO todo_stats (owner_id, complete, priority, count) "
+               "SELECT coalesce(owner_id, 0), coalesce(complete, false), coalesce(priority, 0), count(*) "
+               "FROM todos GROUP BY coalesce(owner_id, 0), coalesce(complete, false), coalesce(priority, 0)")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP TRIGGER IF EXISTS todo_stats_changed ON todos')
+        op.execute('DROP FUNCTION IF EXISTS todo_stats_apply()')
+    else:
+        for name in SQLITE_TRIGGERS:
+            op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.drop_table('todo_stats')
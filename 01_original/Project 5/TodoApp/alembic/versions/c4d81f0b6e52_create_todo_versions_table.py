@@ -0,0 +1,28 @@
+"""create todo versions table
+
+Revision ID: c4d81f0b6e52
+Revises: 9b1f4c7e3a20
+Create Date: 2026-10-17 21:12:08.331904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d81f0b6e52'
+down_revision: Union[str, None] = '9b1f4c7e3a20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('todo_versions',
+                    sa.Column('owner_id', sa.Integer(), sa.ForeignKey('users.id'), primary_key=True),
+                    sa.Column('version', sa.Integer(), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_table('todo_versions')
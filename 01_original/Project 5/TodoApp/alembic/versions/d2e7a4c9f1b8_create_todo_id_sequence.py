@@ -0,0 +1,30 @@
+"""create todo id sequence
+
+Revision ID: d2e7a4c9f1b8
+Revises: aeff25f89db0
+Create Date: 2026-10-17 17:41:26.903518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2e7a4c9f1b8'
+down_revision: Union[str, None] = 'aeff25f89db0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('todo_id_sequence',
+                    sa.Column('id', sa.Integer(), primary_key=True),
+                    sa.Column('next_id', sa.Integer(), nullable=False))
+    # Seeded here so concurrent first creates never race to insert the counter row.
+    op.execute("INSERT INTO todo_id_sequence (id, next_id) SELECT 1, coalesce(max(id), 0) + 1 FROM todos")
+
+
+def downgrade() -> None:
+    op.drop_table('todo_id_sequence')
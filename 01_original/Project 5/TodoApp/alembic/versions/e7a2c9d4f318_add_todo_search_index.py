@@ -0,0 +1,61 @@
+"""add todo search index
+
+Revision ID: e7a2c9d4f318
+Revises: c4d81f0b6e52
+Create Date: 2026-10-17 22:03:51.774120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a2c9d4f318'
+down_revision: Union[str, None] = 'c4d81f0b6e52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SQLITE_TRIGGERS = {
+    'todos_fts_ai': "CREATE TRIGGER todos_fts_ai AFTER INSERT ON todos BEGIN "
+                    "INSERT INTO todos_fts(rowid, title, description, owner_id) "
+                    "VALUES (new.id, new.title, new.description, new.owner_id); END",
+    'todos_fts_ad': "CREATE TRIGGER todos_fts_ad AFTER DELETE ON todos BEGIN "
+                    "INSERT INTO todos_fts(todos_fts, rowid, title, description, owner_id) "
+                    "VALUES ('delete', old.id, old.title, old.description, old.owner_id); END",
+    'todos_fts_au': "CREATE TRIGGER todos_fts_au AFTER UPDATE OF title, description, owner_id ON todos BEGIN "
+                    "INSERT INTO todos_fts(todos_fts, rowid, title, description, owner_id) "
+                    "VALUES ('delete', old.id, old.title, old.description, old.owner_id); "
+                    "INSERT INTO todos_fts(rowid, title, description, owner_id) "
+                    "VALUES (new.id, new.title, new.description, new.owner_id); END",
+}
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+        with op.get_context().autocommit_block():
+            op.execute('CREATE EXTENSION IF NOT EXISTS btree_gin')
+            op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_todos_owner_id_search ON todos USING gin "
+                       "(owner_id, to_tsvector('english', coalesce(title, '') || ' ' || coalesce(description, '')))")
+    elif dialect == 'sqlite':
+        # Other databases, MySQL included, get no search index; the search route answers 501 there.
+        op.execute("CREATE VIRTUAL TABLE todos_fts USING fts5(title, description, owner_id, content='todos', "
+                   "content_rowid='id', tokenize='porter unicode61')")
+        for statement in SQLITE_TRIGGERS.values():
+            op.execute(statement)
+        op.execute("INSERT INTO todos_fts(todos_fts) VALUES ('rebuild')")
+        op.execute("INSERT INTO todos_fts(todos_fts, rank) VALUES ('rank', 'bm25(1.0, 1.0, 0.0)')")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_todos_owner_id_search')
+    elif dialect == 'sqlite':
+        for name in SQLITE_TRIGGERS:
+            op.execute(f'DROP TRIGGER IF EXISTS {name}')
+        op.execute('DROP TABLE IF EXISTS todos_fts')
@@ -0,0 +1,46 @@
+"""add todo change tracking
+
+Revision ID: f3b5d8a1c6e9
+Revises: e7a2c9d4f318
+Create Date: 2026-10-17 23:18:42.510377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b5d8a1c6e9'
+down_revision: Union[str, None] = 'e7a2c9d4f318'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('todos', sa.Column('change_version', sa.Integer(), nullable=False, server_default='0'))
+    op.create_table('todo_tombstones',
+                    sa.Column('todo_id', sa.Integer(), primary_key=True),
+                    sa.Column('change_version', sa.Integer(), primary_key=True),
+                    sa.Column('owner_id', sa.Integer(), sa.ForeignKey('users.id')))
+    op.create_index('ix_todo_tombstones_owner_id_change_version', 'todo_tombstones', ['owner_id', 'change_version'])
+    if op.get_bind().dialect.name == 'postgresql':
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+        with op.get_context().autocommit_block():
+            op.create_index('ix_todos_owner_id_change_version', 'todos', ['owner_id', 'change_version'],
+                            postgresql_concurrently=True, if_not_exists=True)
+    else:
+        op.create_index('ix_todos_owner_id_change_version', 'todos', ['owner_id', 'change_version'])
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.drop_index('ix_todos_owner_id_change_version', table_name='todos',
+                          postgresql_concurrently=True, if_exists=True)
+    else:
+        op.drop_index('ix_todos_owner_id_change_version', table_name='todos')
+    op.drop_table('todo_tombstones')
+    with op.batch_alter_table('todos') as batch_op:
+        batch_op.drop_column('change_version')
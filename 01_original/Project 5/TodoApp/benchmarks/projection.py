@@ -0,0 +1,46 @@
+# Run from the project folder: python -m TodoApp.benchmarks.projection
+import timeit
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from ..database import Base
+from ..models import Todos
+from ..routers.todos import todos_by_owner, project, as_fields
+
+ROWS = 1000
+NUMBER = 50
+
+engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+Base.metadata.create_all(bind=engine)
+SessionLocal = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+with SessionLocal() as setup:
+    setup.add_all([Todos(title=f'Todo {i}', description='Benchmark todo ' * 5, priority=i % 5 + 1,
+                         complete=False, owner_id=1) for i in range(ROWS)])
+    setup.commit()
+
+FIELDS = ['id', 'title', 'complete']
+projected_by_owner = project(todos_by_owner, FIELDS)
+
+
+def entity_list():
+    with SessionLocal() as db:
+        return [{name: getattr(todo, name) for name in FIELDS}
+                for todo in db.scalars(todos_by_owner, {'owner_id': 1}).all()]
+
+
+def projected_list():
+    with SessionLocal() as db:
+        return as_fields(db.execute(projected_by_owner, {'owner_id': 1}).all(), FIELDS)
+
+
+def measure(function) -> float:
+    function()
+    return min(timeit.repeat(function, number=NUMBER, repeat=3)) / NUMBER * 1000
+
+
+if __name__ == '__main__':
+    entity, projected = measure(entity_list), measure(projected_list)
+    print(f'{ROWS} todos, fields={",".join(FIELDS)}')
+    print(f'{"entities":<12}{entity:>10.2f}ms')
+    print(f'{"columns":<12}{projected:>10.2f}ms{1 - projected / entity:>10.0%} saved')
@@ -0,0 +1,75 @@
+# Run from the project folder: python -m TodoApp.benchmarks.statements
+import timeit
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from ..database import Base
+from ..models import Todos, Users
+from ..routers.todos import todos_by_owner, todo_by_id_and_owner
+from ..routers.auth import user_by_username
+
+NUMBER = 5000
+
+engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+Base.metadata.create_all(bind=engine)
+SessionLocal = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+with SessionLocal() as setup:
+    setup.add(Users(username='bench', email='bench@email.com', hashed_password='x', role='user'))
+    setup.add_all([Todos(title=f'Todo {i}', description='Benchmark todo', priority=i % 5 + 1,
+                         complete=False, owner_id=1 + i % 2) for i in range(20)])
+    setup.commit()
+
+db = SessionLocal()
+
+
+def legacy_owner_list():
+    return db.query(Todos).filter(Todos.owner_id == 1).all()
+
+
+def select_owner_list():
+    return db.scalars(select(Todos).filter(Todos.owner_id == 1)).all()
+
+
+def prebuilt_owner_list():
+    return db.scalars(todos_by_owner, {'owner_id': 1}).all()
+
+
+def legacy_todo_by_id():
+    return db.query(Todos).filter(Todos.id == 3).filter(Todos.owner_id == 1).first()
+
+
+def select_todo_by_id():
+    return db.scalar(select(Todos).filter(Todos.id == 3).filter(Todos.owner_id == 1))
+
+
+def prebuilt_todo_by_id():
+    return db.scalar(todo_by_id_and_owner, {'todo_id': 3, 'owner_id': 1})
+
+
+def legacy_user_by_username():
+    return db.query(Users).filter(Users.username == 'bench').first()
+
+
+def select_user_by_username():
+    return db.scalar(select(Users).filter(Users.username == 'bench'))
+
+
+def prebuilt_user_by_username():
+    return db.scalar(user_by_username, {'username': 'bench'})
+
+
+def measure(function) -> float:
+    function()
+    return min(timeit.repeat(function, number=NUMBER, repeat=3)) / NUMBER * 1_000_000
+
+
+if __name__ == '__main__':
+    print(f'{"query":<22}{"db.query()":>14}{"select()":>14}{"prebuilt":>14}{"saved":>10}')
+    for name, variants in [
+        ('todos by owner', (legacy_owner_list, select_owner_list, prebuilt_owner_list)),
+        ('todo by id and owner', (legacy_todo_by_id, select_todo_by_id, prebuilt_todo_by_id)),
+        ('user by username', (legacy_user_by_username, select_user_by_username, prebuilt_user_by_username)),
+    ]:
+        legacy, built, prebuilt = (measure(variant) for variant in variants)
+        print(f'{name:<22}{legacy:>12.1f}us{built:>12.1f}us{prebuilt:>12.1f}us{1 - prebuilt / legacy:>10.0%}')
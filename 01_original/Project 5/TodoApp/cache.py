@@ -0,0 +1,141 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from .database import env_bool
+from .versions import etag_matches
+
+RESPONSE_CACHE = env_bool('RESPONSE_CACHE', False)
+RESPONSE_CACHE_URL = os.getenv('RESPONSE_CACHE_URL')
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '10000'))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '60'))
+
+
+class LRUBackend:
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    async def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: bytes):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def snapshot(self) -> dict:
+        return {'backend': 'lru', 'entries': len(self._entries), 'max_entries': self.max_entries,
+                'ttl': self.ttl, 'evictions': self.evictions, 'expirations': self.expirations}
+
+
+class SharedBackend:
+    # Any redis.asyncio-compatible client works: get and set(ex=) are all it uses.
+
+    def __init__(self, client, ttl: float):
+        self.client = client
+        self.ttl = ttl
+
+    @classmethod
+    def from_url(cls, url: str, ttl: float):
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError('RESPONSE_CACHE_URL needs the redis package installed.')
+        return cls(redis.from_url(url), ttl)
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.client.get(f'todos:response:{key}')
+
+    async def set(self, key: str, value: bytes):
+        await self.client.set(f'todos:response:{key}', value, ex=max(int(self.ttl), 1))
+
+    def snapshot(self) -> dict:
+        # Evictions happen inside the shared store and are reported by it.
+        return {'backend': 'shared', 'ttl': self.ttl}
+
+
+@lru_cache
+def type_adapter(response_model) -> TypeAdapter:
+    return TypeAdapter(response_model)
+
+
+def render(content, response_model=None) -> bytes:
+    if response_model is None:
+        return json.dumps(jsonable_encoder(content)).encode()
+    adapter = type_adapter(response_model)
+    return adapter.dump_json(adapter.validate_python(content, from_attributes=True), exclude_unset=True)
+
+
+class ResponseCache:
+    # Keys carry the user's version from todo_versions, so a write on any worker retires every worker's entries.
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, user_id: int, version: int, request: Request) -> str | None:
+        if self.backend is None:
+            return None
+        return f'{user_id}:{version}:{request.url.path}?{request.url.query}'
+
+    async def get(self, key: str | None, request: Request) -> Response | None:
+        if key is None:
+            return None
+        value = await self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        etag, _, body = value.partition(b'\n')
+        headers = {'ETag': etag.decode()} if etag else {}
+        if etag and etag_matches(request.headers.get('if-none-match'), etag.decode()):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(body, media_type='application/json', headers=headers)
+
+    async def store(self, key: str | None, content, etag: str | None = None, response_model=None):
+        if key is None:
+            return content
+        body = render(content, response_model)
+        await self.backend.set(key, (etag or '').encode() + b'\n' + body)
+        return Response(body, media_type='application/json', headers={'ETag': etag} if etag else {})
+
+    def snapshot(self) -> dict:
+        if self.backend is None:
+            return {'enabled': False}
+        return {'enabled': True, 'hits': self.hits, 'misses': self.misses, **self.backend.snapshot()}
+
+
+def create_backend():
+    if not RESPONSE_CACHE:
+        return None
+    if RESPONSE_CACHE_URL:
+        return SharedBackend.from_url(RESPONSE_CACHE_URL, RESPONSE_CACHE_TTL)
+    return LRUBackend(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+
+
+response_cache = ResponseCache(create_backend())
@@ -1,11 +1,582 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from itertools import count
+from threading import Lock
+from typing import Annotated
+from fastapi import Depends, Request
+from sqlalchemy import create_engine, event, exc, select, update, Insert, Update, Delete, \
+    MetaData, Table, Column, Integer, Index
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.sql import operators, visitors
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter
 
-SQLALCHEMY_DATABASE_URL = 'sqlite:///./todosapp.db'
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={'check_same_thread': False})
+def env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
 
+
+SQLALCHEMY_DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///./todosapp.db')
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL')
+
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg', 'mysql': 'aiomysql'}
+
+# Pool settings are per worker process: total connections = workers * (size + overflow).
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = env_bool('DB_POOL_PRE_PING', True)
+DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', '10'))
+
+# Production SQLite profile: WAL lets readers run alongside the single writer.
+SQLITE_PRODUCTION = env_bool('SQLITE_PRODUCTION', False)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-64000')),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000')),
+    'temp_store': 'MEMORY',
+}
+
+# Single-writer mode: writes share one connection behind a bounded queue, reads use a pool.
+SQLITE_WRITE_QUEUE = env_bool('SQLITE_WRITE_QUEUE', False)
+WRITE_QUEUE_MAX_DEPTH = int(os.getenv('WRITE_QUEUE_MAX_DEPTH', '64'))
+WRITE_QUEUE_TIMEOUT = float(os.getenv('WRITE_QUEUE_TIMEOUT', '5'))
+
+# Read replicas: GET/HEAD requests read from a replica unless the caller wrote recently.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',')
+                         if url.strip()]
+REPLICA_STRATEGY = os.getenv('REPLICA_STRATEGY', 'round_robin')
+READ_YOUR_WRITES_SECONDS = float(os.getenv('READ_YOUR_WRITES_SECONDS', '5'))
+
+# Owner sharding: todos live in one of N databases chosen by owner_id, everything else on the primary.
+TODO_SHARD_URLS = [url.strip() for url in os.getenv('TODO_SHARD_URLS', '').split(',') if url.strip()]
+# Tables that live next to their owner's todos on the same shard, so a todo write touches one database.
+TODO_SHARDED_TABLES = {'todos', 'todo_stats', 'todo_versions', 'todo_tombstones'}
+# Todo ids are handed out from blocks reserved on the primary, so creates rarely touch it.
+TODO_ID_BLOCK = int(os.getenv('TODO_ID_BLOCK', '100'))
+
+
+def to_async_url(url) -> str:
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS and url.get_driver_name() != ASYNC_DRIVERS[backend]:
+        url = url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+    return url.render_as_string(hide_password=False)
+
+
+def dialect_connect_args(url) -> dict:
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == 'sqlite':
+        return {'check_same_thread': False}
+    if url.get_driver_name() == 'asyncpg':
+        return {'timeout': DB_CONNECT_TIMEOUT, 'server_settings': {'application_name': 'todoapp'}}
+    if backend == 'postgresql':
+        return {'connect_timeout': DB_CONNECT_TIMEOUT, 'application_name': 'todoapp'}
+    if backend == 'mysql':
+        return {'connect_timeout': DB_CONNECT_TIMEOUT}
+    return {}
+
+
+def is_memory_sqlite(url) -> bool:
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def check_sqlite_settings(db_engine) -> dict:
+    if db_engine.dialect.name != 'sqlite':
+        return {}
+    with db_engine.connect() as connection:
+        return {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+                for name in SQLITE_PRAGMAS}
+
+
+def set_query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('PRAGMA query_only=1')
+    finally:
+        cursor.close()
+
+
+class WriteQueueFull(Exception):
+    pass
+
+
+class WriteQueue:
+
+    def __init__(self, max_depth: int):
+        self.max_depth = max_depth
+        self.depth = 0
+        self.peak_depth = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._lock = Lock()
+
+    def enter(self):
+        with self._lock:
+            if self.depth >= self.max_depth:
+                self.rejected += 1
+                raise WriteQueueFull(f'Write queue is full ({self.max_depth} waiting).')
+            self.depth += 1
+            self.peak_depth = max(self.peak_depth, self.depth)
+
+    def leave(self, acquired: bool = True, timed_out: bool = False):
+        with self._lock:
+            self.depth -= 1
+            if acquired:
+                self.acquired += 1
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'peak_depth': self.peak_depth,
+            'acquired': self.acquired,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+        }
+
+
+class WriteQueuePool(QueuePool):
+    write_queue: WriteQueue | None = None
+
+    def _do_get(self):
+        if self.write_queue is None:
+            return super()._do_get()
+        self.write_queue.enter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.write_queue.leave(acquired=False, timed_out=True)
+            raise
+        except BaseException:
+            self.write_queue.leave(acquired=False)
+            raise
+        self.write_queue.leave()
+        return record
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.write_queue = self.write_queue
+        return pool
+
+
+class AsyncWriteQueuePool(WriteQueuePool, AsyncAdaptedQueuePool):
+    pass
+
+
+class ReplicaSet:
+
+    def __init__(self, engines: dict, strategy: str = 'round_robin'):
+        if strategy not in ('round_robin', 'least_connections'):
+            raise ValueError(f'Unknown replica strategy: {strategy}')
+        self.engines = engines
+        self.strategy = strategy
+        self.selections = {name: 0 for name in engines}
+        self._names = list(engines)
+        self._counter = count()
+
+    def choose(self):
+        start = next(self._counter) % len(self._names)
+        names = self._names[start:] + self._names[:start]
+        if self.strategy == 'least_connections':
+            names.sort(key=lambda name: pool_metrics[name].checked_out)
+        name = names[0]
+        self.selections[name] += 1
+        engine = self.engines[name]
+        return getattr(engine, 'sync_engine', engine)
+
+    def snapshot(self) -> dict:
+        return {'strategy': self.strategy, 'selections': dict(self.selections)}
+
+
+class ReadYourWrites:
+
+    def __init__(self, window: float, max_keys: int = 10000):
+        self.window = window
+        self.max_keys = max_keys
+        self._writes = {}
+
+    def mark(self, key: str):
+        now = time.monotonic()
+        if len(self._writes) >= self.max_keys:
+            self._writes = {k: t for k, t in self._writes.items() if now - t < self.window}
+        self._writes[key] = now
+
+    def is_recent(self, key: str) -> bool:
+        written_at = self._writes.get(key)
+        return written_at is not None and time.monotonic() - written_at < self.window
+
+
+class RoutingSession(Session):
+
+    def __init__(self, *args, writer=None, reader=None, replicas: ReplicaSet | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writer = writer
+        self.reader = reader or writer
+        self.replicas = replicas
+        self.replica = None
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        # ORM bulk INSERT/UPDATE asks with the mapper alone, so a bind without a clause is treated as a write.
+        if self._flushing or clause is None or isinstance(clause, (Insert, Update, Delete)):
+            self.info['wrote'] = True
+            return self.writer
+        if self.replicas is not None and self.info.get('read_only'):
+            if self.replica is None:
+                self.replica = self.replicas.choose()
+            return self.replica
+        return self.reader
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def mark_recent_write(session):
+    # Marked at commit, before the response goes out, so the client's next read already sticks to the primary.
+    if session.info.get('wrote') and session.info.get('sticky_key'):
+        read_your_writes.mark(session.info['sticky_key'])
+
+
+def shard_for_owner(owner_id: int) -> str:
+    return f'todos-{owner_id % len(TODO_SHARD_URLS)}'
+
+
+def todo_shards() -> list[str]:
+    return [f'todos-{i}' for i in range(len(TODO_SHARD_URLS))]
+
+
+def is_todos_mapper(mapper) -> bool:
+    return mapper is not None and mapper.local_table.name in TODO_SHARDED_TABLES
+
+
+def owner_ids_in(statement, params=None) -> set:
+    whereclause = getattr(statement, 'whereclause', None)
+    params = params if isinstance(params, dict) else {}
+    owner_ids = set()
+    if isinstance(statement, Insert) and params.get('owner_id') is not None:
+        # Single-row inserts and upserts, e.g. bump_todo_version, name their owner in the parameters.
+        owner_ids.add(params['owner_id'])
+    if whereclause is None:
+        return owner_ids
+    for element in visitors.iterate(whereclause):
+        if not isinstance(element, BinaryExpression) or not isinstance(element.right, BindParameter):
+            continue
+        column = element.left
+        if getattr(column, 'key', None) != 'owner_id' or getattr(column, 'table', None) is None \
+                or getattr(column.table, 'name', None) not in TODO_SHARDED_TABLES:
+            continue
+        value = params.get(element.right.key, element.right.effective_value)
+        if element.operator is operators.eq:
+            owner_ids.add(value)
+        elif element.operator is operators.in_op:
+            owner_ids.update(value)
+    return owner_ids
+
+
+def shard_chooser(mapper, instance, clause=None):
+    if not is_todos_mapper(mapper):
+        return 'primary'
+    if instance is not None and instance.owner_id is not None:
+        return shard_for_owner(instance.owner_id)
+    owner_ids = owner_ids_in(clause)
+    return shard_for_owner(owner_ids.pop()) if len(owner_ids) == 1 else todo_shards()[0]
+
+
+def identity_chooser(mapper, primary_key, **kw):
+    return todo_shards() if is_todos_mapper(mapper) else ['primary']
+
+
+def execute_chooser(orm_context):
+    if not is_todos_mapper(orm_context.bind_mapper):
+        return ['primary']
+    owner_ids = owner_ids_in(orm_context.statement, orm_context.parameters)
+    if owner_ids:
+        return sorted({shard_for_owner(owner_id) for owner_id in owner_ids})
+    return todo_shards()
+
+
+class TodoIdBlocks:
+
+    def __init__(self, size: int):
+        self.size = size
+        self._ids = {}
+        self._lock = Lock()
+
+    def take(self, engine, count: int) -> list[int]:
+        while True:
+            with self._lock:
+                ids = self._ids.setdefault(engine, deque())
+                if len(ids) >= count:
+                    return [ids.popleft() for _ in range(count)]
+            block = self.reserve(engine, max(self.size, count))
+            with self._lock:
+                self._ids[engine].extend(block)
+
+    @staticmethod
+    def reserve(engine, size: int) -> range:
+        # Its own short transaction: the counter row stays locked only for this UPDATE, not for the request.
+        with engine.begin() as connection:
+            reserved = connection.execute(update(todo_id_sequence)
+                                          .values(next_id=todo_id_sequence.c.next_id + size))
+            if reserved.rowcount != 1:
+                raise RuntimeError('todo_id_sequence has no counter row; run the Alembic migrations.')
+            next_id = connection.scalar(select(todo_id_sequence.c.next_id))
+        return range(next_id - size, next_id)
+
+
+class TodoShardedSession(ShardedSession):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, shard_chooser=shard_chooser, identity_chooser=identity_chooser,
+                         execute_chooser=execute_chooser, **kwargs)
+
+
+@event.listens_for(TodoShardedSession, 'before_flush')
+def allocate_todo_ids(session, flush_context, instances):
+    # Shards cannot share an autoincrement, so todo ids come from a counter on the primary.
+    new_todos = [obj for obj in session.new if getattr(obj, '__tablename__', None) == 'todos' and obj.id is None]
+    if not new_todos:
+        return
+    for todo, todo_id in zip(new_todos, todo_id_blocks.take(session.get_bind(shard_id='primary'), len(new_todos))):
+        todo.id = todo_id
+
+
+class PoolMetrics:
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.peak_checked_out = 0
+        self.checked_out = 0
+        self._lock = Lock()
+
+        event.listen(engine, 'connect', self.on_connect)
+        event.listen(engine, 'checkout', self.on_checkout)
+        event.listen(engine, 'checkin', self.on_checkin)
+        event.listen(engine, 'invalidate', self.on_invalidate)
+
+    def on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self) -> dict:
+        pool = self.engine.pool
+        data = {
+            'pool': type(pool).__name__,
+            'connects': self.connects,
+            'checkouts': self.checkouts,
+            'checkins': self.checkins,
+            'invalidations': self.invalidations,
+            'checked_out': self.checked_out,
+            'peak_checked_out': self.peak_checked_out,
+        }
+        if isinstance(pool, QueuePool):
+            data.update({'size': pool.size(), 'checked_in': pool.checkedin(),
+                         'overflow': pool.overflow()})
+        return data
+
+
+pool_metrics: dict[str, PoolMetrics] = {}
+
+
+def create_db_engine(url: str = SQLALCHEMY_DATABASE_URL, name: str = 'primary',
+                     is_async: bool = False, **overrides):
+    options = {
+        'connect_args': dialect_connect_args(url),
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+    if not is_memory_sqlite(url):
+        options.update({
+            'pool_size': DB_POOL_SIZE,
+            'max_overflow': DB_MAX_OVERFLOW,
+            'pool_timeout': DB_POOL_TIMEOUT,
+            'pool_recycle': DB_POOL_RECYCLE,
+        })
+    options.update(overrides)
+
+    db_engine = create_async_engine(url, **options) if is_async else create_engine(url, **options)
+    sync_engine = db_engine.sync_engine if is_async else db_engine
+    if SQLITE_PRODUCTION and sync_engine.dialect.name == 'sqlite':
+        event.listen(sync_engine, 'connect', apply_sqlite_pragmas)
+    pool_metrics[name] = PoolMetrics(sync_engine)
+    return db_engine
+
+
+def create_writer_engine(url: str, write_queue: WriteQueue, name: str = 'primary',
+                         is_async: bool = False):
+    poolclass = AsyncWriteQueuePool if is_async else WriteQueuePool
+    db_engine = create_db_engine(url, name=name, is_async=is_async, poolclass=poolclass,
+                                 pool_size=1, max_overflow=0, pool_timeout=WRITE_QUEUE_TIMEOUT)
+    sync_engine = db_engine.sync_engine if is_async else db_engine
+    sync_engine.pool.write_queue = write_queue
+    return db_engine
+
+
+def create_reader_engine(url: str, name: str = 'reader', is_async: bool = False):
+    db_engine = create_db_engine(url, name=name, is_async=is_async)
+    sync_engine = db_engine.sync_engine if is_async else db_engine
+    event.listen(sync_engine, 'connect', set_query_only)
+    return db_engine
+
+
+def get_pool_metrics() -> dict:
+    return {name: metrics.snapshot() for name, metrics in pool_metrics.items()}
+
+
+def get_write_queue_metrics() -> dict:
+    if write_queue is None:
+        return {'enabled': False}
+    return {'enabled': True, **write_queue.snapshot()}
+
+
+def get_replica_metrics() -> dict:
+    if replicas is None:
+        return {'enabled': False}
+    return {'enabled': True, **replicas.snapshot()}
+
+
+def shard_table(table: Table) -> Table:
+    # Same columns, indexes and after_create hooks, minus foreign keys: the users table they point at
+    # stays on the primary.
+    return Table(table.name, shard_metadata,
+                 *(Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable,
+                          autoincrement=column.autoincrement,
+                          server_default=column.server_default.arg if column.server_default else None)
+                   for column in table.columns),
+                 *(Index(index.name, *(column.name for column in index.columns), unique=index.unique)
+                   for index in table.indexes),
+                 listeners=[('after_create', listener) for listener in table.dispatch.after_create])
+
+
+def create_shard_tables():
+    if not shard_metadata.tables:
+        for table in Base.metadata.sorted_tables:
+            if table.name in TODO_SHARDED_TABLES:
+                shard_table(table)
+    for url in TODO_SHARD_URLS:
+        shard_engine = create_engine(url, connect_args=dialect_connect_args(url))
+        shard_metadata.create_all(bind=shard_engine)
+        shard_engine.dispose()
+
+
+def sticky_key(request: Request) -> str:
+    token = request.headers.get('authorization') or request.cookies.get('access_token')
+    if token:
+        return token
+    return request.client.host if request.client else ''
+
+
+@asynccontextmanager
+async def request_session(request: Request):
+    key = sticky_key(request)
+    read_only = request.method in ('GET', 'HEAD') and not read_your_writes.is_recent(key)
+    async with AsyncSessionLocal(info={'read_only': read_only, 'sticky_key': key}) as db:
+        yield db
+
+
+async def get_db(request: Request):
+    # Sessions connect on their first statement, so early exits never touch the pool.
+    async with request_session(request) as db:
+        yield db
+
+
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+
+
+write_queue = None
+if SQLITE_WRITE_QUEUE and make_url(SQLALCHEMY_DATABASE_URL).get_backend_name() == 'sqlite' \
+        and not is_memory_sqlite(SQLALCHEMY_DATABASE_URL):
+    write_queue = WriteQueue(WRITE_QUEUE_MAX_DEPTH)
+
+# The sync engine serves migrations, create_all and scripts; requests use the async engines.
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL, name='sync')
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+ASYNC_DATABASE_URL = ASYNC_DATABASE_URL or to_async_url(SQLALCHEMY_DATABASE_URL)
+
+if write_queue is not None:
+    async_engine = create_writer_engine(ASYNC_DATABASE_URL, write_queue, is_async=True)
+    async_reader_engine = create_reader_engine(ASYNC_DATABASE_URL, is_async=True)
+else:
+    async_engine = create_db_engine(ASYNC_DATABASE_URL, is_async=True)
+    async_reader_engine = async_engine
+
+replicas = None
+if DATABASE_REPLICA_URLS:
+    replicas = ReplicaSet({f'replica-{i}': create_db_engine(to_async_url(url), name=f'replica-{i}',
+                                                           is_async=True)
+                           for i, url in enumerate(DATABASE_REPLICA_URLS)}, REPLICA_STRATEGY)
+
+read_your_writes = ReadYourWrites(READ_YOUR_WRITES_SECONDS)
+
+if TODO_SHARD_URLS:
+    shards = {'primary': async_engine.sync_engine}
+    for i, url in enumerate(TODO_SHARD_URLS):
+        shards[f'todos-{i}'] = create_db_engine(to_async_url(url), name=f'todos-{i}', is_async=True).sync_engine
+    AsyncSessionLocal = async_sessionmaker(sync_session_class=TodoShardedSession, shards=shards,
+                                           autoflush=False, expire_on_commit=False)
+elif write_queue is not None or replicas is not None:
+    AsyncSessionLocal = async_sessionmaker(sync_session_class=RoutingSession,
+                                           writer=async_engine.sync_engine,
+                                           reader=async_reader_engine.sync_engine,
+                                           replicas=replicas,
+                                           autoflush=False, expire_on_commit=False)
+else:
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False,
+                                           expire_on_commit=False)
+
 Base = declarative_base()
+# Filled by create_shard_tables with the TODO_SHARDED_TABLES part of Base.metadata.
+shard_metadata = MetaData()
+
+todo_id_sequence = Table('todo_id_sequence', Base.metadata,
+                         Column('id', Integer, primary_key=True),
+                         Column('next_id', Integer, nullable=False))
+
+todo_id_blocks = TodoIdBlocks(TODO_ID_BLOCK)
+
+
+@event.listens_for(todo_id_sequence, 'after_create')
+def seed_todo_id_sequence(target, connection, **kw):
+    connection.execute(target.insert().values(id=1, next_id=1))
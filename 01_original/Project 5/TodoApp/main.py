@@ -1,13 +1,34 @@
+import logging
 from fastapi import FastAPI, Request, status
+from sqlalchemy import exc
 from .models import Base
-from .database import engine
+from .database import engine, get_pool_metrics, get_write_queue_metrics, get_replica_metrics, \
+    check_sqlite_settings, create_shard_tables, WriteQueueFull, TODO_SHARD_URLS
 from .routers import auth, todos, admin, users
+from .cache import response_cache
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, JSONResponse
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
 Base.metadata.create_all(bind=engine)
+if TODO_SHARD_URLS:
+    create_shard_tables()
+
+sqlite_settings = check_sqlite_settings(engine)
+if sqlite_settings:
+    logger.info('SQLite settings in effect: %s', sqlite_settings)
+
+
+@app.exception_handler(WriteQueueFull)
+@app.exception_handler(exc.TimeoutError)
+async def database_busy_handler(request: Request, error: Exception):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        content={'detail': 'Database is busy, try again later.'},
+                        headers={'Retry-After': '1'})
+
 
 app.mount("/static", StaticFiles(directory="TodoApp/static"), name="static")
 
@@ -22,6 +43,31 @@ def health_check():
     return {'status': 'Healthy'}
 
 
+@app.get("/metrics/pool")
+def pool_metrics():
+    return get_pool_metrics()
+
+
+@app.get("/metrics/write-queue")
+def write_queue_metrics():
+    return get_write_queue_metrics()
+
+
+@app.get("/metrics/replicas")
+def replica_metrics():
+    return get_replica_metrics()
+
+
+@app.get("/metrics/cache")
+def cache_metrics():
+    return response_cache.snapshot()
+
+
+@app.get("/metrics/sqlite")
+def sqlite_metrics():
+    return sqlite_settings
+
+
 app.include_router(auth.router)
 app.include_router(todos.router)
 app.include_router(admin.router)
@@ -1,5 +1,6 @@
 from .database import Base
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Index
+from sqlalchemy.orm import deferred
 
 
 class Users(Base):
@@ -14,6 +15,8 @@ class Users(Base):
     is_active = Column(Boolean, default=True)
     role = Column(String)
     phone_number = Column(String)
+    # Bumped by profile writes; keys cached GET /user responses apart from the todo version.
+    profile_version = deferred(Column(Integer, nullable=False, default=0, server_default='0'))
 
 
 class Todos(Base):
@@ -25,3 +28,39 @@ class Todos(Base):
     priority = Column(Integer)
     complete = Column(Boolean, default=False)
     owner_id = Column(Integer, ForeignKey("users.id"))
+    change_version = deferred(Column(Integer, nullable=False, default=0, server_default='0'))
+
+    __table_args__ = (
+        Index('ix_todos_owner_id_id', 'owner_id', 'id'),
+        Index('ix_todos_owner_id_complete_priority', 'owner_id', 'complete', 'priority'),
+        Index('ix_todos_owner_id_priority_id', 'owner_id', 'priority', 'id'),
+        Index('ix_todos_owner_id_change_version', 'owner_id', 'change_version'),
+    )
+
+
+class TodoStats(Base):
+    __tablename__ = 'todo_stats'
+
+    owner_id = Column(Integer, primary_key=True)
+    complete = Column(Boolean, primary_key=True)
+    priority = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class TodoVersions(Base):
+    __tablename__ = 'todo_versions'
+
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class TodoTombstones(Base):
+    __tablename__ = 'todo_tombstones'
+
+    todo_id = Column(Integer, primary_key=True)
+    change_version = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"))
+
+    __table_args__ = (
+        Index('ix_todo_tombstones_owner_id_change_version', 'owner_id', 'change_version'),
+    )
@@ -1,11 +1,13 @@
 from typing import Annotated
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+from sqlalchemy import select, delete, bindparam
 from fastapi import APIRouter, Depends, HTTPException, Path
 from starlette import status
 from ..models import Todos
-from ..database import SessionLocal
+from ..database import db_dependency
+from ..versions import bump_todo_version, add_tombstones
 from .auth import get_current_user
+from .todos import TodoResponse, delete_owned_todo
 
 router = APIRouter(
     prefix='/admin',
@@ -13,34 +15,39 @@ router = APIRouter(
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-db_dependency = Annotated[Session, Depends(get_db)]
 user_dependency = Annotated[dict, Depends(get_current_user)]
 
+delete_todo_by_id = delete(Todos).filter(Todos.id == bindparam('todo_id'))
+owner_of_todo = select(Todos.owner_id).filter(Todos.id == bindparam('todo_id'))
 
-@router.get("/todo", status_code=status.HTTP_200_OK)
+
+@router.get("/todo", status_code=status.HTTP_200_OK, response_model=list[TodoResponse])
 async def read_all(user: user_dependency, db: db_dependency):
     if user is None or user.get('user_role') != 'admin':
         raise HTTPException(status_code=401, detail='Authentication Failed')
-    return db.query(Todos).all()
+    return (await db.scalars(select(Todos))).all()
 
 
 @router.delete("/todo/{todo_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_todo(user: user_dependency, db: db_dependency, todo_id: int = Path(gt=0)):
     if user is None or user.get('user_role') != 'admin':
         raise HTTPException(status_code=401, detail='Authentication Failed')
-    todo_model = db.query(Todos).filter(Todos.id == todo_id).first()
-    if todo_model is None:
+    params = {'todo_id': todo_id}
+    todo = (await db.execute(owner_of_todo, params)).first()
+    if todo is None:
+        raise HTTPException(status_code=404, detail='Todo not found.')
+    if todo.owner_id is None:
+        deleted = (await db.execute(delete_todo_by_id, params,
+                                    execution_options={'synchronize_session': False})).rowcount > 0
+    else:
+        # Version row before todo row, the same lock order as the owner's own writes.
+        version = await bump_todo_version(db, todo.owner_id)
+        deleted = await delete_owned_todo(db, todo.owner_id, todo_id)
+        if deleted:
+            add_tombstones(db, todo.owner_id, [todo_id], version)
+    if not deleted:
         raise HTTPException(status_code=404, detail='Todo not found.')
-    db.query(Todos).filter(Todos.id == todo_id).delete()
-    db.commit()
+    await db.commit()
 
 
 
@@ -2,9 +2,9 @@ from datetime import timedelta, datetime, timezone
 from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import select, bindparam
 from starlette import status
-from ..database import SessionLocal
+from ..database import db_dependency
 from ..models import Users
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
@@ -38,18 +38,10 @@ class Token(BaseModel):
     token_type: str
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-db_dependency = Annotated[Session, Depends(get_db)]
-
 templates = Jinja2Templates(directory="TodoApp/templates")
 
+user_by_username = select(Users).filter(Users.username == bindparam('username'))
+
 
 ### Pages ###
 
@@ -62,8 +54,8 @@ def render_register_page(request: Request):
     return templates.TemplateResponse("register.html", {"request": request})
 
 ### Endpoints ###
-def authenticate_user(username: str, password: str, db):
-    user = db.query(Users).filter(Users.username == username).first()
+async def authenticate_user(username: str, password: str, db):
+    user = await db.scalar(user_by_username, {'username': username})
     if not user:
         return False
     if not bcrypt_context.verify(password, user.hashed_password):
@@ -108,13 +100,13 @@ async def create_user(db: db_dependency,
     )
 
     db.add(create_user_model)
-    db.commit()
+    await db.commit()
 
 
 @router.post("/token", response_model=Token)
 async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
                                  db: db_dependency):
-    user = authenticate_user(form_data.username, form_data.password, db)
+    user = await authenticate_user(form_data.username, form_data.password, db)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail='Could not validate user.')
@@ -1,12 +1,22 @@
-from typing import Annotated
-from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
-from fastapi import APIRouter, Depends, HTTPException, Path, Request, status
+import base64
+import binascii
+import json
+import os
+from typing import Annotated, Any, Literal
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError, model_validator
+from sqlalchemy import select, insert, update, delete, bindparam, and_, or_
+from sqlalchemy.engine import make_url
+from fastapi import APIRouter, Body, Depends, HTTPException, Path, Query, Request, Response, status
 from starlette import status
 from ..models import Todos
-from ..database import SessionLocal
+from ..database import db_dependency, TodoShardedSession, SQLALCHEMY_DATABASE_URL, env_bool
+from ..search import search_todos, search_terms, SEARCH_BACKENDS
+from ..cache import response_cache
+from ..stats import todo_stats_by_owner, todo_counters_by_owner, summarize
+from ..versions import get_todo_version, bump_todo_version, add_tombstones, get_tombstones, todo_etag, \
+    etag_matches
 from .auth import get_current_user
-from starlette.responses import RedirectResponse
+from starlette.responses import RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 
 templates = Jinja2Templates(directory="TodoApp/templates")
@@ -17,17 +27,29 @@ router = APIRouter(
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-db_dependency = Annotated[Session, Depends(get_db)]
 user_dependency = Annotated[dict, Depends(get_current_user)]
 
+# Built once at import; the compiled SQL is then reused from the statement cache on every request.
+todos_by_owner = select(Todos).filter(Todos.owner_id == bindparam('owner_id'))
+todo_by_id_and_owner = select(Todos).filter(Todos.id == bindparam('todo_id'))\
+    .filter(Todos.owner_id == bindparam('owner_id'))
+delete_todo_by_id_and_owner = delete(Todos).filter(Todos.id == bindparam('todo_id'))\
+    .filter(Todos.owner_id == bindparam('owner_id'))
+todos_changed_since = select(Todos).filter(Todos.owner_id == bindparam('owner_id'))\
+    .filter(Todos.change_version > bindparam('since')).order_by(Todos.change_version, Todos.id)
+# Keyset page over the (owner_id, id) index: cost depends on the page size, not on its depth.
+todos_page = select(Todos).filter(Todos.owner_id == bindparam('owner_id'))\
+    .filter(Todos.id > bindparam('after_id')).order_by(Todos.id).limit(bindparam('limit'))
+
+TODO_PAGE_SIZE = 50
+TODO_PAGE_MAX = 500
+TODO_BULK_MAX = int(os.getenv('TODO_BULK_MAX', '1000'))
+TODO_STREAM_BATCH = int(os.getenv('TODO_STREAM_BATCH', '500'))
+TODO_DELETE_CHUNK = int(os.getenv('TODO_DELETE_CHUNK', '500'))
+TODO_STATS_COUNTERS = env_bool('TODO_STATS_COUNTERS', False)
+SEARCH_BACKEND = make_url(SQLALCHEMY_DATABASE_URL).get_backend_name()
+TODO_FIELDS = ('id', 'title', 'description', 'priority', 'complete', 'owner_id')
+
 
 class TodoRequest(BaseModel):
     title: str = Field(min_length=3)
@@ -36,6 +58,283 @@ class TodoRequest(BaseModel):
     complete: bool
 
 
+class TodoResponse(BaseModel):
+    # Every field is optional so fields= projections serialize with response_model_exclude_unset.
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int | None = None
+    title: str | None = None
+    description: str | None = None
+    priority: int | None = None
+    complete: bool | None = None
+    owner_id: int | None = None
+
+
+class TodoPage(BaseModel):
+    todos: list[TodoResponse]
+    next_cursor: str | None
+
+
+class TodoSync(BaseModel):
+    version: int
+    todos: list[TodoResponse]
+    deleted: list[int]
+
+
+class TodoStatsResponse(BaseModel):
+    total: int
+    open: int
+    completed: int
+    by_priority: dict[int, int]
+
+
+class TodoFilters(BaseModel):
+    complete: bool | None = None
+    priority_min: int | None = Field(None, gt=0, lt=6)
+    priority_max: int | None = Field(None, gt=0, lt=6)
+    title_prefix: str | None = Field(None, min_length=1, max_length=100)
+    sort: Literal['id', 'priority', '-priority'] = 'id'
+
+    def is_default(self) -> bool:
+        return self == DEFAULT_FILTERS
+
+
+DEFAULT_FILTERS = TodoFilters()
+
+
+class TodoChanges(BaseModel):
+    title: str | None = Field(None, min_length=3)
+    description: str | None = Field(None, min_length=3, max_length=100)
+    priority: int | None = Field(None, gt=0, lt=6)
+    complete: bool | None = None
+
+    @model_validator(mode='after')
+    def check_changes(self):
+        if not self.model_dump(exclude_none=True):
+            raise ValueError('No changes given.')
+        return self
+
+
+class BulkTarget(BaseModel):
+    ids: list[int] | None = Field(None, min_length=1, max_length=TODO_BULK_MAX)
+    filters: TodoFilters | None = None
+
+    @model_validator(mode='after')
+    def check_target(self):
+        if (self.ids is None) == (self.filters is None):
+            raise ValueError('Give either ids or filters.')
+        # Sort only orders rows: filters without a condition would match every todo the caller owns.
+        if self.filters is not None and not self.filters.model_dump(exclude_none=True, exclude={'sort'}):
+            raise ValueError('Give at least one filter.')
+        return self
+
+    def conditions(self, owner_id: int) -> list:
+        if self.ids is not None:
+            return [Todos.owner_id == owner_id, Todos.id.in_(self.ids)]
+        return filter_conditions(owner_id, self.filters)
+
+
+class BulkUpdateRequest(BulkTarget):
+    changes: TodoChanges
+
+
+class CreateOperation(BaseModel):
+    op: Literal['create']
+    todo: TodoRequest
+
+
+class UpdateOperation(BaseModel):
+    op: Literal['update']
+    id: int = Field(gt=0)
+    changes: TodoChanges
+
+
+class DeleteOperation(BaseModel):
+    op: Literal['delete']
+    id: int = Field(gt=0)
+
+
+batch_operation = TypeAdapter(Annotated[CreateOperation | UpdateOperation | DeleteOperation,
+                                        Field(discriminator='op')])
+
+
+class BatchRequest(BaseModel):
+    # atomic commits every operation or none of them; best_effort commits whatever succeeded.
+    mode: Literal['atomic', 'best_effort'] = 'atomic'
+    operations: list[Any] = Field(min_length=1, max_length=TODO_BULK_MAX)
+
+
+def parse_fields(fields: str | None = Query(None, description='Comma-separated todo columns to return, '
+                                                             'e.g. id,title,complete.')) -> list[str] | None:
+    if fields is None:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(',') if name.strip()))
+    if not names or not set(names) <= set(TODO_FIELDS):
+        raise HTTPException(status_code=400, detail='Invalid fields.')
+    return names
+
+
+fields_dependency = Annotated[list[str] | None, Depends(parse_fields)]
+
+
+def project(statement, fields: list[str], sort: str = 'id'):
+    # Select plain columns instead of the entity; the cursor key columns are always loaded.
+    keys = dict.fromkeys([*fields, 'id', *(['priority'] if sort != 'id' else [])])
+    return statement.with_only_columns(*(getattr(Todos, name) for name in keys))
+
+
+async def fetch_todos(db, statement, params: dict, fields: list[str] | None = None, sort: str = 'id'):
+    if fields is None:
+        return (await db.scalars(statement, params)).all()
+    return (await db.execute(project(statement, fields, sort), params)).all()
+
+
+def as_fields(rows, fields: list[str] | None):
+    if fields is None:
+        return rows
+    return [{name: getattr(row, name) for name in fields} for row in rows]
+
+
+async def stream_todos(db, statement, params: dict, fields: list[str] | None = None):
+    # yield_per keeps a server-side cursor open and hands rows over one batch at a time.
+    fields = fields or list(TODO_FIELDS)
+    result = await db.stream(project(statement, fields).execution_options(yield_per=TODO_STREAM_BATCH), params)
+    async for rows in result.partitions():
+        yield ''.join(json.dumps(todo) + '\n' for todo in as_fields(rows, fields)).encode()
+
+
+def encode_cursor(todo, sort: str = 'id') -> str:
+    key = {'id': todo.id}
+    if sort != 'id':
+        key['priority'] = todo.priority
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str, sort: str = 'id') -> dict:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail='Invalid cursor.')
+    fields = {'id'} if sort == 'id' else {'id', 'priority'}
+    if not isinstance(key, dict) or set(key) != fields or not all(isinstance(key[f], int) for f in fields):
+        raise HTTPException(status_code=400, detail='Invalid cursor.')
+    return key
+
+
+def filter_conditions(owner_id: int, filters: TodoFilters) -> list:
+    conditions = [Todos.owner_id == owner_id]
+    if filters.complete is not None:
+        conditions.append(Todos.complete == filters.complete)
+    if filters.priority_min is not None:
+        conditions.append(Todos.priority >= filters.priority_min)
+    if filters.priority_max is not None:
+        conditions.append(Todos.priority <= filters.priority_max)
+    if filters.title_prefix:
+        conditions.append(Todos.title.startswith(filters.title_prefix, autoescape=True))
+    return conditions
+
+
+def filtered_todos(owner_id: int, filters: TodoFilters):
+    statement = select(Todos).filter(*filter_conditions(owner_id, filters))
+    if filters.sort == 'priority':
+        return statement.order_by(Todos.priority, Todos.id)
+    if filters.sort == '-priority':
+        return statement.order_by(Todos.priority.desc(), Todos.id.desc())
+    return statement.order_by(Todos.id)
+
+
+def after_cursor(statement, key: dict, sort: str):
+    if sort == 'id':
+        return statement.filter(Todos.id > key['id'])
+    if sort == 'priority':
+        return statement.filter(or_(Todos.priority > key['priority'],
+                                    and_(Todos.priority == key['priority'], Todos.id > key['id'])))
+    return statement.filter(or_(Todos.priority < key['priority'],
+                                and_(Todos.priority == key['priority'], Todos.id < key['id'])))
+
+
+async def read_page(db, owner_id: int, cursor: str | None, limit: int,
+                    filters: TodoFilters = DEFAULT_FILTERS, fields: list[str] | None = None):
+    if filters.is_default():
+        after_id = decode_cursor(cursor)['id'] if cursor else 0
+        statement = todos_page
+        params = {'owner_id': owner_id, 'after_id': after_id, 'limit': limit + 1}
+    else:
+        statement = filtered_todos(owner_id, filters)
+        if cursor:
+            statement = after_cursor(statement, decode_cursor(cursor, filters.sort), filters.sort)
+        statement = statement.limit(limit + 1)
+        params = {}
+    todos = await fetch_todos(db, statement, params, fields, filters.sort)
+    next_cursor = encode_cursor(todos[limit - 1], filters.sort) if len(todos) > limit else None
+    return as_fields(todos[:limit], fields), next_cursor
+
+
+async def insert_todos(db, rows: list[dict]) -> list[int]:
+    if isinstance(db.sync_session, TodoShardedSession):
+        # Ids come from the primary's counter, so each shard gets a single executemany.
+        todo_models = [Todos(**row) for row in rows]
+        db.add_all(todo_models)
+        await db.flush()
+        return [todo_model.id for todo_model in todo_models]
+    # sort_by_parameter_order lines RETURNING up with the input rows, so each id maps back to its item.
+    return list((await db.scalars(insert(Todos).returning(Todos.id, sort_by_parameter_order=True), rows)).all())
+
+
+async def update_owned_todo(db, owner_id: int, todo_id: int, values: dict) -> bool:
+    statement = update(Todos).filter(Todos.id == todo_id).filter(Todos.owner_id == owner_id).values(**values)\
+        .execution_options(synchronize_session=False)
+    if db.get_bind(Todos.__mapper__).dialect.update_returning:
+        return await db.scalar(statement.returning(Todos.id)) is not None
+    # MySQL has no UPDATE ... RETURNING; its drivers report matched rows, so rowcount still means "found".
+    return (await db.execute(statement)).rowcount > 0
+
+
+async def delete_owned_todo(db, owner_id: int, todo_id: int) -> bool:
+    params = {'todo_id': todo_id, 'owner_id': owner_id}
+    options = {'synchronize_session': False}
+    if db.get_bind(Todos.__mapper__).dialect.delete_returning:
+        return await db.scalar(delete_todo_by_id_and_owner.returning(Todos.id), params,
+                               execution_options=options) is not None
+    return (await db.execute(delete_todo_by_id_and_owner, params, execution_options=options)).rowcount > 0
+
+
+async def delete_in_chunks(db, owner_id: int, conditions: list) -> int:
+    # Each chunk commits on its own, so SQLite never holds the write lock for the whole delete.
+    deleted = 0
+    while True:
+        version = await bump_todo_version(db, owner_id)
+        # Ids first, locked, then the DELETE: MySQL rejects LIMIT in an IN subquery on the table being deleted.
+        deleted_ids = (await db.scalars(select(Todos.id).filter(*conditions).limit(TODO_DELETE_CHUNK)
+                                        .with_for_update())).all()
+        if not deleted_ids:
+            await db.rollback()
+            return deleted
+        await db.execute(delete(Todos).filter(*conditions, Todos.id.in_(deleted_ids))
+                         .execution_options(synchronize_session=False))
+        add_tombstones(db, owner_id, deleted_ids, version)
+        await db.commit()
+        deleted += len(deleted_ids)
+        if len(deleted_ids) < TODO_DELETE_CHUNK:
+            return deleted
+
+
+def not_modified(request: Request, response: Response, owner_id: int, version: int,
+                 variant: str = '') -> Response | None:
+    etag = todo_etag(owner_id, version, variant)
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    response.headers['ETag'] = etag
+    return None
+
+
+def vary_on_accept(result):
+    # Responses built here bypass the route's response headers, so they get Vary themselves.
+    if isinstance(result, Response):
+        result.headers['Vary'] = 'Accept'
+    return result
+
+
 def redirect_to_login():
     redirect_response = RedirectResponse(url="/auth/login-page", status_code=status.HTTP_302_FOUND)
     redirect_response.delete_cookie(key="access_token")
@@ -45,16 +344,17 @@ def redirect_to_login():
 ### Pages ###
 
 @router.get("/todo-page")
-async def render_todo_page(request: Request, db: db_dependency):
+async def render_todo_page(request: Request, db: db_dependency, cursor: str | None = None):
     try:
         user = await get_current_user(request.cookies.get('access_token'))
 
         if user is None:
             return redirect_to_login()
 
-        todos = db.query(Todos).filter(Todos.owner_id == user.get("id")).all()
+        todos, next_cursor = await read_page(db, user.get("id"), cursor, TODO_PAGE_SIZE)
 
-        return templates.TemplateResponse("todo.html", {"request": request, "todos": todos, "user": user})
+        return templates.TemplateResponse("todo.html", {"request": request, "todos": todos, "user": user,
+                                                        "next_cursor": next_cursor})
 
     except:
         return redirect_to_login()
@@ -82,7 +382,7 @@ async def render_edit_todo_page(request: Request, todo_id: int, db: db_dependenc
         if user is None:
             return redirect_to_login()
 
-        todo = db.query(Todos).filter(Todos.id == todo_id).first()
+        todo = await db.scalar(select(Todos).filter(Todos.id == todo_id))
 
         return templates.TemplateResponse("edit-todo.html", {"request": request, "todo": todo, "user": user})
 
@@ -92,22 +392,105 @@ async def render_edit_todo_page(request: Request, todo_id: int, db: db_dependenc
 
 
 ### Endpoints ###
-@router.get("/", status_code=status.HTTP_200_OK)
-async def read_all(user: user_dependency, db: db_dependency):
+@router.get("/", status_code=status.HTTP_200_OK, response_model=TodoPage | list[TodoResponse],
+            response_model_exclude_unset=True)
+async def read_all(user: user_dependency, db: db_dependency, request: Request, response: Response,
+                   filters: Annotated[TodoFilters, Depends()],
+                   fields: fields_dependency,
+                   limit: int = Query(TODO_PAGE_SIZE, gt=0, le=TODO_PAGE_MAX),
+                   cursor: str | None = None,
+                   all: bool = Query(False, description='Return every todo as a plain list (unpaginated).')):
     if user is None:
         raise HTTPException(status_code=401, detail='Authentication Failed')
-    return db.query(Todos).filter(Todos.owner_id == user.get('id')).all()
-
-
-@router.get("/todo/{todo_id}", status_code=status.HTTP_200_OK)
-async def read_todo(user: user_dependency, db: db_dependency, todo_id: int = Path(gt=0)):
+    version = await get_todo_version(db, user.get('id'))
+    streaming = 'application/x-ndjson' in request.headers.get('accept', '')
+    # JSON and NDJSON share this URL, so each format has its own ETag and caches key on Accept.
+    response.headers['Vary'] = 'Accept'
+    cache_key = None if streaming else response_cache.key(user.get('id'), version, request)
+    if cached := await response_cache.get(cache_key, request):
+        return vary_on_accept(cached)
+    if unchanged := not_modified(request, response, user.get('id'), version, '.ndjson' if streaming else ''):
+        return vary_on_accept(unchanged)
+    if streaming:
+        statement = filtered_todos(user.get('id'), filters)
+        return StreamingResponse(stream_todos(db, statement, {}, fields), media_type='application/x-ndjson',
+                                 headers={'ETag': response.headers['etag'], 'Vary': 'Accept'})
+    if all and filters.is_default():
+        content = as_fields(await fetch_todos(db, todos_by_owner, {'owner_id': user.get('id')}, fields), fields)
+    elif all:
+        content = as_fields(await fetch_todos(db, filtered_todos(user.get('id'), filters), {}, fields), fields)
+    else:
+        todos, next_cursor = await read_page(db, user.get('id'), cursor, limit, filters, fields)
+        content = {'todos': todos, 'next_cursor': next_cursor}
+    return vary_on_accept(await response_cache.store(cache_key, content, response.headers['etag'],
+                                                     TodoPage if isinstance(content, dict) else list[TodoResponse]))
+
+
+@router.get("/changes", status_code=status.HTTP_200_OK, response_model=TodoSync)
+async def read_changes(user: user_dependency, db: db_dependency,
+                       since: int | None = Query(None, ge=0, description='The version returned by the last sync; '
+                                                                         'leave it out for a full snapshot.')):
     if user is None:
         raise HTTPException(status_code=401, detail='Authentication Failed')
-
-    todo_model = db.query(Todos).filter(Todos.id == todo_id)\
-        .filter(Todos.owner_id == user.get('id')).first()
-    if todo_model is not None:
-        return todo_model
+    # Read the version first: a write landing in between is sent again next time, never skipped.
+    version = await get_todo_version(db, user.get('id'))
+    if since is None:
+        todos = (await db.scalars(todos_by_owner, {'owner_id': user.get('id')})).all()
+        return {'version': version, 'todos': todos, 'deleted': []}
+    if since > version:
+        raise HTTPException(status_code=400, detail='Invalid sync token.')
+    todos = (await db.scalars(todos_changed_since, {'owner_id': user.get('id'), 'since': since})).all()
+    changed_ids = {todo.id for todo in todos}
+    deleted = [todo_id for todo_id in await get_tombstones(db, user.get('id'), since) if todo_id not in changed_ids]
+    return {'version': version, 'todos': todos, 'deleted': sorted(set(deleted))}
+
+
+@router.get("/stats", status_code=status.HTTP_200_OK, response_model=TodoStatsResponse)
+async def read_stats(user: user_dependency, db: db_dependency, request: Request, response: Response):
+    if user is None:
+        raise HTTPException(status_code=401, detail='Authentication Failed')
+    version = await get_todo_version(db, user.get('id'))
+    if unchanged := not_modified(request, response, user.get('id'), version):
+        return unchanged
+    statement = todo_counters_by_owner if TODO_STATS_COUNTERS else todo_stats_by_owner
+    return summarize((await db.execute(statement, {'owner_id': user.get('id')})).all())
+
+
+@router.get("/search", status_code=status.HTTP_200_OK, response_model=list[TodoResponse],
+            response_model_exclude_unset=True)
+async def search(user: user_dependency, db: db_dependency, request: Request, response: Response,
+                 fields: fields_dependency, q: str = Query(min_length=1, max_length=200),
+                 limit: int = Query(TODO_PAGE_SIZE, gt=0, le=TODO_PAGE_MAX)):
+    if user is None:
+        raise HTTPException(status_code=401, detail='Authentication Failed')
+    if SEARCH_BACKEND not in SEARCH_BACKENDS:
+        raise HTTPException(status_code=501, detail='Search is not available on this database.')
+    version = await get_todo_version(db, user.get('id'))
+    if unchanged := not_modified(request, response, user.get('id'), version):
+        return unchanged
+    if not search_terms(q):
+        return []
+    statement = search_todos(user.get('id'), q, SEARCH_BACKEND).limit(limit)
+    return as_fields(await fetch_todos(db, statement, {}, fields), fields)
+
+
+@router.get("/todo/{todo_id}", status_code=status.HTTP_200_OK, response_model=TodoResponse,
+            response_model_exclude_unset=True)
+async def read_todo(user: user_dependency, db: db_dependency, request: Request, response: Response,
+                    fields: fields_dependency, todo_id: int = Path(gt=0)):
+    if user is None:
+        raise HTTPException(status_code=401, detail='Authentication Failed')
+    version = await get_todo_version(db, user.get('id'))
+    cache_key = response_cache.key(user.get('id'), version, request)
+    if cached := await response_cache.get(cache_key, request):
+        return cached
+    if unchanged := not_modified(request, response, user.get('id'), version):
+        return unchanged
+
+    todos = await fetch_todos(db, todo_by_id_and_owner, {'todo_id': todo_id, 'owner_id': user.get('id')}, fields)
+    if todos:
+        return await response_cache.store(cache_key, as_fields(todos, fields)[0], response.headers['etag'],
+                                          TodoResponse)
     raise HTTPException(status_code=404, detail='Todo not found.')
 
 
@@ -116,10 +499,68 @@ async def create_todo(user: user_dependency, db: db_dependency,
                       todo_request: TodoRequest):
     if user is None:
         raise HTTPException(status_code=401, detail='Authentication Failed')
-    todo_model = Todos(**todo_request.model_dump(), owner_id=user.get('id'))
+    version = await bump_todo_version(db, user.get('id'))
+    todo_model = Todos(**todo_request.model_dump(), owner_id=user.get('id'), change_version=version)
 
     db.add(todo_model)
-    db.commit()
+    await db.commit()
+
+
+@router.post("/bulk", status_code=status.HTTP_201_CREATED)
+async def create_todos(user: user_dependency, db: db_dependency,
+                       todo_requests: Annotated[list[Any], Body()]):
+    if user is None:
+        raise HTTPException(status_code=401, detail='Authentication Failed')
+    if len(todo_requests) > TODO_BULK_MAX:
+        raise HTTPException(status_code=413, detail=f'Too many todos; the limit is {TODO_BULK_MAX}.')
+
+    rows = []
+    errors = []
+    for index, item in enumerate(todo_requests):
+        try:
+            todo_request = TodoRequest.model_validate(item)
+        except ValidationError as e:
+            errors.append({'index': index, 'errors': e.errors(include_url=False, include_context=False)})
+            continue
+        rows.append({**todo_request.model_dump(), 'owner_id': user.get('id')})
+
+    ids = []
+    if rows:
+        version = await bump_todo_version(db, user.get('id'))
+        ids = await insert_todos(db, [{**row, 'change_version': version} for row in rows])
+        await db.commit()
+    return {'ids': ids, 'errors': errors}
+
+
+@router.patch("/bulk", status_code=status.HTTP_200_OK)
+async def update_todos(user: user_dependency, db: db_dependency, bulk_request: BulkUpdateRequest):
+    if user is None:
+        raise HTTPException(status_code=401, detail='Authentication Failed')
+
+    version = await bump_todo_version(db, user.get('id'))
+    result = await db.execute(update(Todos).filter(*bulk_request.conditions(user.get('id')))
+                              .values(**bulk_request.changes.model_dump(exclude_none=True), change_version=version)
+                              .execution_options(synchronize_session=False))
+    if result.rowcount:
+        await db.commit()
+    else:
+        await db.rollback()
+    return {'updated': result.rowcount}
+
+
+@router.delete("/bulk", status_code=status.HTTP_200_OK)
+async def delete_todos(user: user_dependency, db: db_dependency, bulk_request: BulkTarget):
+    if user is None:
+        raise HTTPException(status_code=401, detail='Authentication Failed')
+    return {'deleted': await delete_in_chunks(db, user.get('id'), bulk_request.conditions(user.get('id')))}
+
+
+@router.delete("/completed", status_code=status.HTTP_200_OK)
+async def clear_completed(user: user_dependency, db: db_dependency):
+    if user is None:
+        raise HTTPException(status_code=401, detail='Authentication Failed')
+    conditions = filter_conditions(user.get('id'), TodoFilters(complete=True))
+    return {'deleted': await delete_in_chunks(db, user.get('id'), conditions)}
 
 
 @router.put("/todo/{todo_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -129,18 +570,25 @@ async def update_todo(user: user_dependency, db: db_dependency,
     if user is None:
         raise HTTPException(status_code=401, detail='Authentication Failed')
 
-    todo_model = db.query(Todos).filter(Todos.id == todo_id)\
-        .filter(Todos.owner_id == user.get('id')).first()
-    if todo_model is None:
+    version = await bump_todo_version(db, user.get('id'))
+    if not await update_owned_todo(db, user.get('id'), todo_id,
+                                   {**todo_request.model_dump(), 'change_version': version}):
         raise HTTPException(status_code=404, detail='Todo not found.')
+    await db.commit()
 
-    todo_model.title = todo_request.title
-    todo_model.description = todo_request.description
-    todo_model.priority = todo_request.priority
-    todo_model.complete = todo_request.complete
 
-    db.add(todo_model)
-    db.commit()
+@router.patch("/todo/{todo_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def patch_todo(user: user_dependency, db: db_dependency,
+                     todo_changes: TodoChanges,
+                     todo_id: int = Path(gt=0)):
+    if user is None:
+        raise HTTPException(status_code=401, detail='Authentication Failed')
+    changes = todo_changes.model_dump(exclude_none=True)
+
+    version = await bump_todo_version(db, user.get('id'))
+    if not await update_owned_todo(db, user.get('id'), todo_id, {**changes, 'change_version': version}):
+        raise HTTPException(status_code=404, detail='Todo not found.')
+    await db.commit()
 
 
 @router.delete("/todo/{todo_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -148,13 +596,63 @@ async def delete_todo(user: user_dependency, db: db_dependency, todo_id: int = P
     if user is None:
         raise HTTPException(status_code=401, detail='Authentication Failed')
 
-    todo_model = db.query(Todos).filter(Todos.id == todo_id)\
-        .filter(Todos.owner_id == user.get('id')).first()
-    if todo_model is None:
+    version = await bump_todo_version(db, user.get('id'))
+    if not await delete_owned_todo(db, user.get('id'), todo_id):
         raise HTTPException(status_code=404, detail='Todo not found.')
-    db.query(Todos).filter(Todos.id == todo_id).filter(Todos.owner_id == user.get('id')).delete()
+    add_tombstones(db, user.get('id'), [todo_id], version)
+    await db.commit()
+
+
+@router.post("/batch", status_code=status.HTTP_200_OK)
+async def run_batch(user: user_dependency, db: db_dependency, batch_request: BatchRequest, response: Response):
+    if user is None:
+        raise HTTPException(status_code=401, detail='Authentication Failed')
 
-    db.commit()
+    operations = []
+    results = []
+    for index, item in enumerate(batch_request.operations):
+        try:
+            operations.append((index, batch_operation.validate_python(item)))
+        except ValidationError as e:
+            results.append({'index': index, 'status': 422,
+                            'errors': e.errors(include_url=False, include_context=False)})
+    if results and batch_request.mode == 'atomic':
+        response.status_code = status.HTTP_422_UNPROCESSABLE_CONTENT
+        return {'committed': False, 'results': results}
+
+    # One version and one commit for the whole batch, however many operations it holds.
+    version = await bump_todo_version(db, user.get('id'))
+    deleted_ids = []
+    for index, operation in operations:
+        if operation.op == 'create':
+            [todo_id] = await insert_todos(db, [{**operation.todo.model_dump(), 'owner_id': user.get('id'),
+                                                 'change_version': version}])
+            results.append({'index': index, 'status': 201, 'id': todo_id})
+            continue
+        if operation.op == 'update':
+            found = await update_owned_todo(db, user.get('id'), operation.id,
+                                            {**operation.changes.model_dump(exclude_none=True),
+                                             'change_version': version})
+        else:
+            found = await delete_owned_todo(db, user.get('id'), operation.id)
+            if found:
+                deleted_ids.append(operation.id)
+        if not found:
+            results.append({'index': index, 'status': 404, 'detail': 'Todo not found.'})
+            if batch_request.mode == 'atomic':
+                await db.rollback()
+                response.status_code = status.HTTP_409_CONFLICT
+                return {'committed': False, 'results': results}
+        else:
+            results.append({'index': index, 'status': 204, 'id': operation.id})
+
+    results.sort(key=lambda result: result['index'])
+    if not any(result['status'] < 400 for result in results):
+        await db.rollback()
+        return {'committed': False, 'results': results}
+    add_tombstones(db, user.get('id'), deleted_ids, version)
+    await db.commit()
+    return {'committed': True, 'results': results}
 
 
 
@@ -1,10 +1,11 @@
 from typing import Annotated
-from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
-from fastapi import APIRouter, Depends, HTTPException, Path
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy import select, update, bindparam
+from fastapi import APIRouter, Depends, HTTPException, Path, Request
 from starlette import status
 from ..models import Users
-from ..database import SessionLocal
+from ..database import db_dependency
+from ..cache import response_cache
 from .auth import get_current_user
 from passlib.context import CryptContext
 
@@ -14,29 +15,43 @@ router = APIRouter(
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-db_dependency = Annotated[Session, Depends(get_db)]
 user_dependency = Annotated[dict, Depends(get_current_user)]
 bcrypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 
+user_by_id = select(Users).filter(Users.id == bindparam('user_id'))
+profile_version_by_id = select(Users.profile_version).filter(Users.id == bindparam('user_id'))
+
+
+class UserResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    email: str | None
+    username: str | None
+    first_name: str | None
+    last_name: str | None
+    is_active: bool | None
+    role: str | None
+    phone_number: str | None
+
 
 class UserVerification(BaseModel):
     password: str
     new_password: str = Field(min_length=6)
 
 
-@router.get('/', status_code=status.HTTP_200_OK)
-async def get_user(user: user_dependency, db: db_dependency):
+@router.get('/', status_code=status.HTTP_200_OK, response_model=UserResponse | None)
+async def get_user(user: user_dependency, db: db_dependency, request: Request):
     if user is None:
         raise HTTPException(status_code=401, detail='Authentication Failed')
-    return db.query(Users).filter(Users.id == user.get('id')).first()
+    cache_key = None
+    if response_cache.backend is not None:
+        version = await db.scalar(profile_version_by_id, {'user_id': user.get('id')})
+        cache_key = response_cache.key(user.get('id'), version, request)
+    if cached := await response_cache.get(cache_key, request):
+        return cached
+    return await response_cache.store(cache_key, await db.scalar(user_by_id, {'user_id': user.get('id')}),
+                                      response_model=UserResponse | None)
 
 
 @router.put("/password", status_code=status.HTTP_204_NO_CONTENT)
@@ -44,13 +59,14 @@ async def change_password(user: user_dependency, db: db_dependency,
                           user_verification: UserVerification):
     if user is None:
         raise HTTPException(status_code=401, detail='Authentication Failed')
-    user_model = db.query(Users).filter(Users.id == user.get('id')).first()
+    user_model = await db.scalar(user_by_id, {'user_id': user.get('id')})
 
     if not bcrypt_context.verify(user_verification.password, user_model.hashed_password):
         raise HTTPException(status_code=401, detail='Error on password change')
     user_model.hashed_password = bcrypt_context.hash(user_verification.new_password)
+    user_model.profile_version = Users.profile_version + 1
     db.add(user_model)
-    db.commit()
+    await db.commit()
 
 
 @router.put("/phonenumber/{phone_number}", status_code=status.HTTP_204_NO_CONTENT)
@@ -58,10 +74,16 @@ async def change_phonenumber(user: user_dependency, db: db_dependency,
                           phone_number: str):
     if user is None:
         raise HTTPException(status_code=401, detail='Authentication Failed')
-    user_model = db.query(Users).filter(Users.id == user.get('id')).first()
-    user_model.phone_number = phone_number
-    db.add(user_model)
-    db.commit()
+    statement = update(Users).filter(Users.id == user.get('id'))\
+        .values(phone_number=phone_number, profile_version=Users.profile_version + 1)\
+        .execution_options(synchronize_session=False)
+    if db.get_bind(Users.__mapper__).dialect.update_returning:
+        found = await db.scalar(statement.returning(Users.id)) is not None
+    else:
+        found = (await db.execute(statement)).rowcount > 0
+    if not found:
+        raise HTTPException(status_code=404, detail='User not found.')
+    await db.commit()
 
 
 
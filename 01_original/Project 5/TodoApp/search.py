@@ -0,0 +1,69 @@
+import re
+from sqlalchemy import event, select, func, literal_column, table, column
+from .models import Todos
+
+# owner_id is indexed alongside the text so a match is intersected with the owner's rows inside FTS5,
+# instead of ranking every owner's hits and filtering them afterwards.
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts USING fts5("
+    "title, description, owner_id, content='todos', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS todos_fts_ai AFTER INSERT ON todos BEGIN "
+    "INSERT INTO todos_fts(rowid, title, description, owner_id) "
+    "VALUES (new.id, new.title, new.description, new.owner_id); END",
+    "CREATE TRIGGER IF NOT EXISTS todos_fts_ad AFTER DELETE ON todos BEGIN "
+    "INSERT INTO todos_fts(todos_fts, rowid, title, description, owner_id) "
+    "VALUES ('delete', old.id, old.title, old.description, old.owner_id); END",
+    "CREATE TRIGGER IF NOT EXISTS todos_fts_au AFTER UPDATE OF title, description, owner_id ON todos BEGIN "
+    "INSERT INTO todos_fts(todos_fts, rowid, title, description, owner_id) "
+    "VALUES ('delete', old.id, old.title, old.description, old.owner_id); "
+    "INSERT INTO todos_fts(rowid, title, description, owner_id) "
+    "VALUES (new.id, new.title, new.description, new.owner_id); END",
+    # Every row of the owner matches the owner_id filter, so it carries no weight in the ranking.
+    "INSERT INTO todos_fts(todos_fts, rank) VALUES ('rank', 'bm25(1.0, 1.0, 0.0)')",
+]
+# btree_gin lets owner_id lead the GIN index, so the scan covers one owner's entries.
+POSTGRES_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gin",
+    "CREATE INDEX IF NOT EXISTS ix_todos_owner_id_search ON todos USING gin "
+    "(owner_id, to_tsvector('english', coalesce(title, '') || ' ' || coalesce(description, '')))",
+]
+
+# Databases search_todos can query; others, such as MySQL, have no owner-scoped full-text index here.
+SEARCH_BACKENDS = {'sqlite', 'postgresql'}
+
+todos_fts = table('todos_fts', column('rowid'), column('rank'))
+
+# Spelled with literals so Postgres matches the expression in ix_todos_owner_id_search.
+todo_document = func.to_tsvector(literal_column("'english'"),
+                                 func.coalesce(Todos.title, literal_column("''")).op('||')(literal_column("' '"))
+                                 .op('||')(func.coalesce(Todos.description, literal_column("''"))))
+
+
+# Runs only when create_all actually creates todos; existing databases get search from the Alembic revisions.
+@event.listens_for(Todos.__table__, 'after_create')
+def create_todo_search(target, connection, **kw):
+    if connection.dialect.name == 'postgresql':
+        statements = POSTGRES_SEARCH_DDL
+    elif connection.dialect.name == 'sqlite':
+        statements = SQLITE_SEARCH_DDL
+    else:
+        return
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+def search_terms(q: str) -> list[str]:
+    return re.findall(r'\w+', q)
+
+
+def search_todos(owner_id: int, q: str, backend: str = 'sqlite'):
+    if backend == 'postgresql':
+        query = func.websearch_to_tsquery(literal_column("'english'"), q)
+        return select(Todos).filter(Todos.owner_id == owner_id, todo_document.op('@@')(query))\
+            .order_by(func.ts_rank(todo_document, query).desc(), Todos.id)
+    # Quoted prefix terms: user input never reaches the FTS5 query syntax.
+    terms = ' '.join(f'"{term}"*' for term in search_terms(q))
+    match = f'owner_id : "{int(owner_id)}" AND {{title description}} : ({terms})'
+    return select(Todos).join(todos_fts, todos_fts.c.rowid == Todos.id)\
+        .filter(Todos.owner_id == owner_id, literal_column('todos_fts').match(match))\
+        .order_by(todos_fts.c.rank, Todos.id)
@@ -88,6 +88,38 @@
         }
     });
 
+        editTodoForm.querySelector('input[name="complete"]').addEventListener('change', async function (event) {
+            var url = window.location.pathname;
+            const todoId = url.substring(url.lastIndexOf('/') + 1);
+
+            try {
+                const token = getCookie('access_token');
+                if (!token) {
+                    throw new Error('Authentication token not found');
+                }
+
+                const response = await fetch(`/todos/todo/${todoId}`, {
+                    method: 'PATCH',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'Authorization': `Bearer ${token}`
+                    },
+                    body: JSON.stringify({ complete: event.target.checked })
+                });
+
+                if (!response.ok) {
+                    // Handle error
+                    event.target.checked = !event.target.checked;
+                    const errorData = await response.json();
+                    alert(`Error: ${errorData.detail}`);
+                }
+            } catch (error) {
+                event.target.checked = !event.target.checked;
+                console.error('Error:', error);
+                alert('An error occurred. Please try again.');
+            }
+        });
+
         document.getElementById('deleteButton').addEventListener('click', async function () {
             var url = window.location.pathname;
             const todoId = url.substring(url.lastIndexOf('/') + 1);
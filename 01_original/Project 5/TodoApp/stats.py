@@ -0,0 +1,75 @@
+from sqlalchemy import event, select, func, bindparam
+from .models import Todos, TodoStats
+
+# Triggers keep todo_stats in step with every write, including bulk UPDATEs whose old values never reach Python.
+SQLITE_STATS_ADD = "INSERT INTO todo_stats (owner_id, complete, priority, count) " \
+                   "VALUES (coalesce(new.owner_id, 0), coalesce(new.complete, 0), coalesce(new.priority, 0), 1) " \
+                   "ON CONFLICT (owner_id, complete, priority) DO UPDATE SET count = count + 1;"
+SQLITE_STATS_REMOVE = "UPDATE todo_stats SET count = count - 1 WHERE owner_id = coalesce(old.owner_id, 0) " \
+                      "AND complete = coalesce(old.complete, 0) AND priority = coalesce(old.priority, 0);"
+SQLITE_STATS_DDL = {
+    'todo_stats_ai': f"CREATE TRIGGER IF NOT EXISTS todo_stats_ai AFTER INSERT ON todos BEGIN {SQLITE_STATS_ADD} END",
+    'todo_stats_ad': f"CREATE TRIGGER IF NOT EXISTS todo_stats_ad AFTER DELETE ON todos BEGIN {SQLITE_STATS_REMOVE} END",
+    'todo_stats_au': "CREATE TRIGGER IF NOT EXISTS todo_stats_au AFTER UPDATE OF owner_id, complete, priority "
+                     f"ON todos BEGIN {SQLITE_STATS_REMOVE} {SQLITE_STATS_ADD} END",
+}
+POSTGRES_STATS_DDL = [
+    "CREATE OR REPLACE FUNCTION todo_stats_apply() RETURNS trigger AS $$ BEGIN "
+    "IF TG_OP IN ('UPDATE', 'DELETE') THEN "
+    "UPDATE todo_stats SET count = count - 1 WHERE owner_id = coalesce(OLD.owner_id, 0) "
+    "AND complete = coalesce(OLD.complete, false) AND priority = coalesce(OLD.priority, 0); "
+    "END IF; "
+    "IF TG_OP IN ('INSERT', 'UPDATE') THEN "
+    "INSERT INTO todo_stats (owner_id, complete, priority, count) "
+    "VALUES (coalesce(NEW.owner_id, 0), coalesce(NEW.complete, false), coalesce(NEW.priority, 0), 1) "
+    "ON CONFLICT (owner_id, complete, priority) DO UPDATE SET count = todo_stats.count + 1; "
+    "END IF; "
+    "RETURN NULL; END $$ LANGUAGE plpgsql",
+    "CREATE OR REPLACE TRIGGER todo_stats_changed AFTER INSERT OR DELETE OR UPDATE OF owner_id, complete, priority "
+    "ON todos FOR EACH ROW EXECUTE FUNCTION todo_stats_apply()",
+]
+MYSQL_STATS_ADD = "INSERT INTO todo_stats (owner_id, complete, priority, count) " \
+                  "VALUES (coalesce(NEW.owner_id, 0), coalesce(NEW.complete, false), coalesce(NEW.priority, 0), 1) " \
+                  "ON DUPLICATE KEY UPDATE count = count + 1;"
+MYSQL_STATS_REMOVE = "UPDATE todo_stats SET count = count - 1 WHERE owner_id = coalesce(OLD.owner_id, 0) " \
+                     "AND complete = coalesce(OLD.complete, false) AND priority = coalesce(OLD.priority, 0);"
+# MySQL has no UPDATE OF column list, so the update trigger compares the counted columns itself.
+MYSQL_STATS_DDL = [
+    f"CREATE TRIGGER todo_stats_ai AFTER INSERT ON todos FOR EACH ROW BEGIN {MYSQL_STATS_ADD} END",
+    f"CREATE TRIGGER todo_stats_ad AFTER DELETE ON todos FOR EACH ROW BEGIN {MYSQL_STATS_REMOVE} END",
+    "CREATE TRIGGER todo_stats_au AFTER UPDATE ON todos FOR EACH ROW BEGIN "
+    "IF NOT (OLD.owner_id <=> NEW.owner_id AND OLD.complete <=> NEW.complete AND OLD.priority <=> NEW.priority) "
+    f"THEN {MYSQL_STATS_REMOVE} {MYSQL_STATS_ADD} END IF; END",
+]
+
+# Served from ix_todos_owner_id_complete_priority alone.
+todo_stats_by_owner = select(Todos.complete, Todos.priority, func.count())\
+    .filter(Todos.owner_id == bindparam('owner_id')).group_by(Todos.complete, Todos.priority)
+todo_counters_by_owner = select(TodoStats.complete, TodoStats.priority, TodoStats.count)\
+    .filter(TodoStats.owner_id == bindparam('owner_id')).filter(TodoStats.count > 0)
+
+
+# Runs only when create_all actually creates todos, so there is nothing to backfill; existing databases get
+# the triggers from the Alembic revision.
+@event.listens_for(Todos.__table__, 'after_create')
+def create_todo_stats_triggers(target, connection, **kw):
+    if connection.dialect.name == 'postgresql':
+        statements = POSTGRES_STATS_DDL
+    elif connection.dialect.name == 'sqlite':
+        statements = SQLITE_STATS_DDL.values()
+    elif connection.dialect.name == 'mysql':
+        statements = MYSQL_STATS_DDL
+    else:
+        return
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+def summarize(rows) -> dict:
+    stats = {'total': 0, 'open': 0, 'completed': 0, 'by_priority': {}}
+    for complete, priority, count in rows:
+        stats['total'] += count
+        stats['completed' if complete else 'open'] += count
+        stats['by_priority'][priority] = stats['by_priority'].get(priority, 0) + count
+    stats['by_priority'] = dict(sorted(stats['by_priority'].items()))
+    return stats
@@ -1,5 +1,6 @@
 from .utils import *
-from ..routers.admin import get_db, get_current_user
+from ..routers.admin import get_current_user
+from ..database import get_db
 from fastapi import status
 from ..models import Todos
 
@@ -15,14 +16,36 @@ def test_admin_read_all_authenticated(test_todo):
 
 
 def test_admin_delete_todo(test_todo):
-    response = client.delete("/admin/todo/1")
+    with count_statements() as statements:
+        response = client.delete("/admin/todo/1")
     assert response.status_code == 204
+    select_owner, delete_todo = todo_statements(statements)
+    assert select_owner.startswith('SELECT todos.owner_id')
+    assert delete_todo.startswith('DELETE FROM todos') and 'RETURNING' in delete_todo
+    # The owner's version row is written before the todo row, as on the owner's own write paths.
+    assert statements.index(delete_todo) > min(i for i, statement in enumerate(statements)
+                                               if 'todo_versions' in statement)
 
     db = TestingSessionLocal()
     model = db.query(Todos).filter(Todos.id == 1).first()
     assert model is None
 
 
+def test_admin_delete_todo_without_returning(test_todo, monkeypatch):
+    monkeypatch.setattr(async_engine.sync_engine.dialect, 'delete_returning', False)
+    with count_statements() as statements:
+        assert client.delete("/admin/todo/1").status_code == 204
+        assert client.delete("/admin/todo/1").status_code == 404
+    assert not any('RETURNING' in statement for statement in todo_statements(statements))
+    assert client.get('/todos/changes?since=0').json()['deleted'] == [1]
+
+
+def test_admin_delete_todo_changes_owner_etag(test_todo):
+    etag = client.get("/todos").headers['etag']
+    client.delete("/admin/todo/1")
+    assert client.get("/todos", headers={'If-None-Match': etag}).status_code == status.HTTP_200_OK
+
+
 def test_admin_delete_todo_not_found():
     response = client.delete("/admin/todo/9999")
     assert response.status_code == 404
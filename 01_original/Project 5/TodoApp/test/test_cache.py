@@ -0,0 +1,147 @@
+import pytest
+from .utils import *
+from .. import cache
+from ..cache import LRUBackend, SharedBackend, ResponseCache, response_cache
+from ..database import get_db
+from ..routers.todos import get_current_user
+from starlette.requests import Request
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+class LocalClient:
+    # Stands in for a redis.asyncio client.
+
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, name):
+        return self.values.get(name)
+
+    async def set(self, name, value, ex=None):
+        self.values[name] = value
+
+
+@pytest.fixture
+def lru_cache(monkeypatch):
+    monkeypatch.setattr(response_cache, 'backend', LRUBackend(max_entries=100, ttl=60))
+    for counter in ('hits', 'misses'):
+        monkeypatch.setattr(response_cache, counter, 0)
+    yield response_cache
+
+
+def make_request(path='/todos/', query='', headers=()):
+    return Request({'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode(),
+                    'headers': list(headers)})
+
+
+@pytest.mark.asyncio
+async def test_lru_backend_evicts_least_recently_used():
+    backend = LRUBackend(max_entries=2, ttl=60)
+    await backend.set('a', b'1')
+    await backend.set('b', b'2')
+    await backend.get('a')
+    await backend.set('c', b'3')
+
+    assert await backend.get('b') is None
+    assert await backend.get('a') == b'1'
+    assert backend.snapshot()['evictions'] == 1
+
+
+@pytest.mark.asyncio
+async def test_lru_backend_expires_entries(monkeypatch):
+    backend = LRUBackend(max_entries=2, ttl=5)
+    await backend.set('a', b'1')
+
+    later = cache.time.monotonic() + 10
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: later)
+    assert await backend.get('a') is None
+    assert backend.snapshot()['expirations'] == 1
+
+
+@pytest.mark.asyncio
+async def test_shared_backend_keys_by_version():
+    response_cache = ResponseCache(SharedBackend(LocalClient(), ttl=60))
+    key = response_cache.key(1, 1, make_request())
+    await response_cache.store(key, {'todos': []}, 'W/"1.1"')
+
+    assert (await response_cache.get(key, make_request())).body == b'{"todos": []}'
+    not_modified = await response_cache.get(key, make_request(headers=[(b'if-none-match', b'W/"1.1"')]))
+    assert not_modified.status_code == 304
+
+    assert await response_cache.get(response_cache.key(1, 2, make_request()), make_request()) is None
+    assert response_cache.snapshot() == {'enabled': True, 'hits': 2, 'misses': 1, 'backend': 'shared', 'ttl': 60}
+
+
+def test_read_all_served_from_cache(test_todo, lru_cache):
+    first = client.get("/todos")
+
+    with count_statements() as statements:
+        second = client.get("/todos")
+        not_modified = client.get("/todos", headers={'If-None-Match': first.headers['etag']})
+    assert len(statements) == 2 and all('todo_versions' in statement for statement in statements)
+    assert second.json() == first.json()
+    assert second.headers['etag'] == first.headers['etag']
+    assert not_modified.status_code == 304
+    assert lru_cache.hits == 2
+
+
+def test_cached_listing_varies_on_accept(test_todo, lru_cache):
+    assert client.get("/todos").headers['vary'] == 'Accept'
+    cached = client.get("/todos")
+    assert lru_cache.hits == 1
+    assert cached.headers['vary'] == 'Accept'
+
+
+def test_cached_responses_match_response_models(test_todo, test_user, lru_cache):
+    for url in ("/todos", "/todos?all=true&fields=id,title", "/todos/todo/1?fields=title", "/user"):
+        fresh = client.get(url).json()
+        assert client.get(url).json() == fresh
+    assert client.get("/todos/todo/1?fields=title").json() == {'title': 'Learn to code!'}
+    assert 'hashed_password' not in client.get("/user").json()
+    assert lru_cache.hits == 6
+
+
+def test_todo_writes_invalidate_cache(test_todo, lru_cache):
+    client.get("/todos/todo/1")
+    client.put('/todos/todo/1', json={'title': 'Cached title changed', 'description': 'Need to learn everyday!',
+                                      'priority': 5, 'complete': False})
+    assert client.get("/todos/todo/1").json()['title'] == 'Cached title changed'
+
+    client.get("/todos")
+    client.delete('/admin/todo/1')
+    assert client.get("/todos").json()['todos'] == []
+
+
+def test_writes_from_other_workers_retire_cache(test_todo, lru_cache):
+    first = client.get("/todos")
+
+    # Another worker's write only reaches this one through the database.
+    with engine.connect() as connection:
+        connection.execute(text("UPDATE todos SET title = 'Written elsewhere' WHERE id = 1"))
+        connection.execute(text("INSERT INTO todo_versions (owner_id, version) VALUES (1, 1) "
+                                "ON CONFLICT (owner_id) DO UPDATE SET version = version + 1"))
+        connection.commit()
+
+    assert client.get("/todos").json()['todos'][0]['title'] == 'Written elsewhere'
+    assert client.get("/todos", headers={'If-None-Match': first.headers['etag']}).status_code == 200
+    assert lru_cache.misses == 2
+
+
+def test_user_writes_invalidate_cache(test_user, lru_cache):
+    etag = client.get("/todos").headers['etag']
+    assert client.get("/user").json()['phone_number'] == '(111)-111-1111'
+    client.put("/user/phonenumber/2222222222")
+    assert client.get("/user").json()['phone_number'] == '2222222222'
+    client.put("/user/password", json={'password': 'testpassword', 'new_password': 'newpassword'})
+    client.get("/user")
+    assert lru_cache.misses == 4
+    # Profile edits leave the todo version, and with it the todo ETags, alone.
+    assert client.get("/todos").headers['etag'] == etag
+
+
+def test_cache_metrics(lru_cache):
+    response = client.get("/metrics/cache")
+    assert response.status_code == 200
+    assert response.json()['backend'] == 'lru'
@@ -0,0 +1,362 @@
+import threading
+import time
+import pytest
+from sqlalchemy import text, exc, select, event, inspect
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from .utils import *
+from .. import database
+from ..database import create_db_engine, dialect_connect_args, get_pool_metrics, check_sqlite_settings, \
+    create_writer_engine, create_reader_engine, RoutingSession, WriteQueue, WriteQueueFull, to_async_url, \
+    ReplicaSet, ReadYourWrites, TodoShardedSession, get_db, create_shard_tables
+from ..routers.todos import todos_by_owner, get_current_user
+from ..versions import bump_todo_version
+from starlette.requests import Request
+
+
+def test_dialect_connect_args():
+    assert dialect_connect_args('sqlite:///./todosapp.db') == {'check_same_thread': False}
+    assert 'connect_timeout' in dialect_connect_args('postgresql://user:pw@localhost/todos')
+    assert 'connect_timeout' in dialect_connect_args('mysql+pymysql://user:pw@localhost/todos')
+
+
+def test_to_async_url():
+    assert to_async_url('sqlite:///./todosapp.db') == 'sqlite+aiosqlite:///./todosapp.db'
+    assert to_async_url('postgresql://user:pw@localhost/todos') == 'postgresql+asyncpg://user:pw@localhost/todos'
+    assert to_async_url('postgresql+asyncpg://user:pw@localhost/todos') == 'postgresql+asyncpg://user:pw@localhost/todos'
+
+
+def test_create_db_engine_pool_settings(tmp_path):
+    db_engine = create_db_engine(f'sqlite:///{tmp_path}/pool.db', name='test-pool',
+                                 pool_size=2, max_overflow=1, pool_timeout=5)
+    assert isinstance(db_engine.pool, QueuePool)
+    assert db_engine.pool.size() == 2
+    assert db_engine.pool._max_overflow == 1
+    assert db_engine.pool._timeout == 5
+    db_engine.dispose()
+
+
+def test_pool_metrics_track_checkouts(tmp_path):
+    db_engine = create_db_engine(f'sqlite:///{tmp_path}/metrics.db', name='test-metrics')
+    with db_engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+        assert get_pool_metrics()['test-metrics']['checked_out'] == 1
+
+    metrics = get_pool_metrics()['test-metrics']
+    assert metrics['checkouts'] == 1
+    assert metrics['checkins'] == 1
+    assert metrics['checked_out'] == 0
+    assert metrics['peak_checked_out'] == 1
+    db_engine.dispose()
+
+
+def test_pool_metrics_endpoint():
+    response = client.get('/metrics/pool')
+    assert response.status_code == 200
+    assert 'primary' in response.json()
+
+
+@pytest.mark.asyncio
+async def test_get_db_connects_lazily():
+    request = Request({'type': 'http', 'method': 'GET', 'headers': [], 'client': ('127.0.0.1', 1)})
+    checkouts = get_pool_metrics()['primary']['checkouts']
+
+    sessions = get_db(request)
+    db = await anext(sessions)
+    assert db.sync_session.expire_on_commit is False
+    await sessions.aclose()
+
+    assert get_pool_metrics()['primary']['checkouts'] == checkouts
+
+
+def test_sqlite_production_pragmas(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'SQLITE_PRODUCTION', True)
+    db_engine = create_db_engine(f'sqlite:///{tmp_path}/wal.db', name='test-wal')
+
+    settings = check_sqlite_settings(db_engine)
+    assert settings['journal_mode'] == 'wal'
+    assert settings['synchronous'] == 1
+    assert settings['busy_timeout'] == database.SQLITE_PRAGMAS['busy_timeout']
+    assert settings['cache_size'] == database.SQLITE_PRAGMAS['cache_size']
+    assert settings['temp_store'] == 2
+    db_engine.dispose()
+
+
+def test_sqlite_default_profile_keeps_rollback_journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'SQLITE_PRODUCTION', False)
+    db_engine = create_db_engine(f'sqlite:///{tmp_path}/default.db', name='test-default')
+    assert check_sqlite_settings(db_engine)['journal_mode'] == 'delete'
+    db_engine.dispose()
+
+
+def test_write_queue_times_out_waiting_writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'WRITE_QUEUE_TIMEOUT', 0.1)
+    queue = WriteQueue(max_depth=4)
+    writer = create_writer_engine(f'sqlite:///{tmp_path}/writer.db', queue, name='test-writer')
+
+    with writer.connect():
+        with pytest.raises(exc.TimeoutError):
+            writer.connect()
+
+    assert queue.snapshot()['timeouts'] == 1
+    assert queue.snapshot()['depth'] == 0
+    writer.dispose()
+
+
+def test_write_queue_rejects_when_full(tmp_path):
+    queue = WriteQueue(max_depth=1)
+    writer = create_writer_engine(f'sqlite:///{tmp_path}/full.db', queue, name='test-full')
+    holder = writer.connect()
+
+    def wait_for_writer():
+        with writer.connect():
+            pass
+
+    waiter = threading.Thread(target=wait_for_writer)
+    waiter.start()
+    while queue.depth == 0:
+        time.sleep(0.01)
+
+    with pytest.raises(WriteQueueFull):
+        writer.connect()
+
+    holder.close()
+    waiter.join()
+    assert queue.snapshot()['rejected'] == 1
+    assert queue.snapshot()['acquired'] == 2
+    writer.dispose()
+
+
+def test_routing_session_sends_writes_to_writer(tmp_path):
+    url = f'sqlite:///{tmp_path}/routing.db'
+    writer = create_writer_engine(url, WriteQueue(max_depth=4), name='test-routing-writer')
+    reader = create_reader_engine(url, name='test-routing-reader')
+    Base.metadata.create_all(bind=writer)
+    assert get_pool_metrics()['test-routing-writer']['checkouts'] == 1
+    RoutingSessionLocal = sessionmaker(class_=RoutingSession, writer=writer, reader=reader,
+                                       autoflush=False)
+
+    db = RoutingSessionLocal()
+    db.add(Todos(title='Write', description='Goes to the writer', priority=1,
+                 complete=False, owner_id=1))
+    db.commit()
+    assert db.query(Todos).count() == 1
+    db.close()
+
+    assert get_pool_metrics()['test-routing-writer']['checkouts'] == 2
+    assert get_pool_metrics()['test-routing-reader']['checkouts'] == 1
+    with reader.connect() as connection:
+        with pytest.raises(exc.OperationalError):
+            connection.execute(text('DELETE FROM todos'))
+    writer.dispose()
+    reader.dispose()
+
+
+@pytest.mark.asyncio
+async def test_async_routing_session_uses_write_queue(tmp_path):
+    url = f'sqlite:///{tmp_path}/async.db'
+    Base.metadata.create_all(bind=create_db_engine(url, name='test-async-setup'))
+    queue = WriteQueue(max_depth=4)
+    writer = create_writer_engine(to_async_url(url), queue, name='test-async-writer', is_async=True)
+    reader = create_reader_engine(to_async_url(url), name='test-async-reader', is_async=True)
+    AsyncRoutingSessionLocal = async_sessionmaker(sync_session_class=RoutingSession,
+                                                  writer=writer.sync_engine, reader=reader.sync_engine,
+                                                  autoflush=False, expire_on_commit=False)
+
+    async with AsyncRoutingSessionLocal() as db:
+        db.add(Todos(title='Async', description='Queued write', priority=1,
+                     complete=False, owner_id=1))
+        await db.commit()
+        assert (await db.scalars(select(Todos))).one().title == 'Async'
+
+    assert queue.snapshot()['acquired'] == 1
+    assert get_pool_metrics()['test-async-reader']['checkouts'] == 1
+    await writer.dispose()
+    await reader.dispose()
+
+
+@pytest.fixture
+def write_queue_db(tmp_path, monkeypatch):
+    url = f'sqlite:///{tmp_path}/queued.db'
+    Base.metadata.create_all(bind=create_db_engine(url, name='test-queued-setup'))
+    writer = create_writer_engine(to_async_url(url), WriteQueue(max_depth=4), name='test-queued-writer',
+                                  is_async=True)
+    reader = create_reader_engine(to_async_url(url), name='test-queued-reader', is_async=True)
+    QueuedSessionLocal = async_sessionmaker(sync_session_class=RoutingSession, writer=writer.sync_engine,
+                                            reader=reader.sync_engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_queued_db():
+        async with QueuedSessionLocal() as db:
+            yield db
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, override_get_queued_db)
+    monkeypatch.setitem(app.dependency_overrides, get_current_user, override_get_current_user)
+    yield QueuedSessionLocal
+
+
+def test_write_queue_bulk_create(write_queue_db):
+    response = client.post('/todos/bulk', json=[{'title': f'Queued {i}', 'description': 'Through the writer',
+                                                 'priority': 2, 'complete': False} for i in range(2)])
+    assert response.status_code == 201
+    assert response.json() == {'ids': [1, 2], 'errors': []}
+    assert [todo['title'] for todo in client.get('/todos?all=true').json()] == ['Queued 0', 'Queued 1']
+
+
+def test_write_queue_batch(write_queue_db):
+    operations = [{'op': 'create', 'todo': {'title': 'Queued', 'description': 'Through the writer',
+                                            'priority': 2, 'complete': False}},
+                  {'op': 'update', 'id': 1, 'changes': {'complete': True}}]
+    response = client.post('/todos/batch', json={'operations': operations})
+    assert response.status_code == 200
+    assert response.json()['committed'] is True
+    assert client.get('/todos/todo/1').json()['complete'] is True
+
+
+def test_replica_set_round_robin(tmp_path):
+    engines = {name: create_db_engine(f'sqlite:///{tmp_path}/{name}.db', name=name)
+               for name in ('test-rr-a', 'test-rr-b')}
+    replica_set = ReplicaSet(engines)
+
+    chosen = [replica_set.choose() for _ in range(4)]
+    assert chosen == [engines['test-rr-a'], engines['test-rr-b'], engines['test-rr-a'], engines['test-rr-b']]
+    assert replica_set.snapshot()['selections'] == {'test-rr-a': 2, 'test-rr-b': 2}
+
+
+def test_replica_set_least_connections(tmp_path):
+    engines = {name: create_db_engine(f'sqlite:///{tmp_path}/{name}.db', name=name)
+               for name in ('test-lc-a', 'test-lc-b')}
+    replica_set = ReplicaSet(engines, strategy='least_connections')
+
+    with engines['test-lc-a'].connect():
+        assert [replica_set.choose() for _ in range(2)] == [engines['test-lc-b']] * 2
+
+
+def test_read_your_writes_window(monkeypatch):
+    tracker = ReadYourWrites(window=5)
+    tracker.mark('token')
+    assert tracker.is_recent('token')
+    assert not tracker.is_recent('other-token')
+
+    later = time.monotonic() + 10
+    monkeypatch.setattr(database.time, 'monotonic', lambda: later)
+    assert not tracker.is_recent('token')
+
+
+def test_routing_session_marks_write_at_commit(tmp_path):
+    url = f'sqlite:///{tmp_path}/sticky.db'
+    writer = create_db_engine(url, name='test-sticky')
+    Base.metadata.create_all(bind=writer)
+    RoutingSessionLocal = sessionmaker(class_=RoutingSession, writer=writer, autoflush=False)
+
+    db = RoutingSessionLocal(info={'sticky_key': 'sticky-token'})
+    db.add(Todos(title='Sticky', description='Marked at commit', priority=1, complete=False, owner_id=1))
+    assert not database.read_your_writes.is_recent('sticky-token')
+    db.commit()
+    assert database.read_your_writes.is_recent('sticky-token')
+    db.close()
+    writer.dispose()
+
+
+@pytest.mark.asyncio
+async def test_routing_session_reads_from_replica(tmp_path):
+    primary_url = f'sqlite:///{tmp_path}/primary.db'
+    replica_url = f'sqlite:///{tmp_path}/replica.db'
+    for url in (primary_url, replica_url):
+        Base.metadata.create_all(bind=create_db_engine(url, name='test-replica-setup'))
+    primary = create_db_engine(to_async_url(primary_url), name='test-replica-primary', is_async=True)
+    replica_set = ReplicaSet({'test-replica-0': create_db_engine(to_async_url(replica_url),
+                                                                name='test-replica-0', is_async=True)})
+    AsyncRoutingSessionLocal = async_sessionmaker(sync_session_class=RoutingSession,
+                                                  writer=primary.sync_engine, replicas=replica_set,
+                                                  autoflush=False, expire_on_commit=False)
+
+    async with AsyncRoutingSessionLocal() as db:
+        db.add(Todos(title='Primary', description='Only on the primary', priority=1,
+                     complete=False, owner_id=1))
+        await db.commit()
+        assert db.info['wrote']
+        assert len((await db.scalars(select(Todos))).all()) == 1
+
+    async with AsyncRoutingSessionLocal(info={'read_only': True}) as db:
+        assert (await db.scalars(select(Todos))).all() == []
+
+    assert replica_set.snapshot()['selections'] == {'test-replica-0': 1}
+
+
+def enforce_foreign_keys(dbapi_connection, connection_record):
+    dbapi_connection.execute('PRAGMA foreign_keys=ON')
+
+
+@pytest.mark.asyncio
+async def test_sharded_session_routes_todos_by_owner(tmp_path, monkeypatch):
+    shard_urls = [f'sqlite:///{tmp_path}/shard{i}.db' for i in range(2)]
+    primary_url = f'sqlite:///{tmp_path}/sharded-primary.db'
+    monkeypatch.setattr(database, 'TODO_SHARD_URLS', shard_urls)
+    create_shard_tables()
+    sync_engines = {}
+    shards = {}
+    for name, url in [('primary', primary_url), ('todos-0', shard_urls[0]), ('todos-1', shard_urls[1])]:
+        sync_engines[name] = create_db_engine(url, name=f'test-{name}-setup')
+        shards[name] = create_db_engine(to_async_url(url), name=f'test-{name}', is_async=True).sync_engine
+        if name != 'primary':
+            event.listen(shards[name], 'connect', enforce_foreign_keys)
+    Base.metadata.create_all(bind=sync_engines['primary'])
+    ShardedSessionLocal = async_sessionmaker(sync_session_class=TodoShardedSession, shards=shards,
+                                             autoflush=False, expire_on_commit=False)
+
+    async with ShardedSessionLocal() as db:
+        db.add_all([Todos(title=f'Todo {owner_id}', description='Sharded', priority=1,
+                          complete=False, owner_id=owner_id) for owner_id in (1, 2, 3)])
+        await db.commit()
+
+        owner_two = (await db.scalars(select(Todos).filter(Todos.owner_id == 2))).all()
+        assert [todo.title for todo in owner_two] == ['Todo 2']
+        owner_three = (await db.scalars(todos_by_owner, {'owner_id': 3})).all()
+        assert [todo.title for todo in owner_three] == ['Todo 3']
+        all_todos = (await db.scalars(select(Todos))).all()
+        assert sorted(todo.id for todo in all_todos) == [1, 2, 3]
+        assert [await bump_todo_version(db, 2) for _ in range(2)] == [1, 2]
+        await db.commit()
+
+    async with ShardedSessionLocal() as db:
+        db.add(Todos(title='Todo 4', description='Sharded', priority=1, complete=False, owner_id=1))
+        await db.commit()
+
+    with sync_engines['todos-0'].connect() as connection:
+        assert connection.execute(text('SELECT owner_id FROM todos')).scalars().all() == [2]
+        assert 'users' not in inspect(connection).get_table_names()
+        assert inspect(connection).get_foreign_keys('todos') == []
+        assert connection.execute(text('SELECT owner_id, version FROM todo_versions')).all() == [(2, 2)]
+        assert {'todo_tombstones', 'todos_fts'} <= set(inspect(connection).get_table_names())
+        assert connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'todo_stats_ai'")).first()
+    with sync_engines['todos-1'].connect() as connection:
+        assert sorted(connection.execute(text('SELECT id, owner_id FROM todos')).all()) == [(1, 1), (3, 3), (4, 1)]
+    with sync_engines['primary'].connect() as connection:
+        assert connection.execute(text('SELECT count(*) FROM todos')).scalar() == 0
+        # Both sessions drew from one reserved block.
+        assert connection.execute(text('SELECT next_id FROM todo_id_sequence')).scalar() == 1 + database.TODO_ID_BLOCK
+        assert connection.execute(text('SELECT count(*) FROM todo_versions')).scalar() == 0
+
+
+def test_todo_id_blocks_do_not_overlap(tmp_path):
+    engine = create_db_engine(f'sqlite:///{tmp_path}/ids.db', name='test-id-blocks')
+    Base.metadata.create_all(bind=engine)
+    blocks = database.TodoIdBlocks(3)
+    taken = []
+
+    def take():
+        for _ in range(5):
+            taken.extend(blocks.take(engine, 2))
+
+    threads = [threading.Thread(target=take) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(taken) == list(range(1, 41))
+    with engine.begin() as connection:
+        connection.execute(text('DELETE FROM todo_id_sequence'))
+    with pytest.raises(RuntimeError):
+        database.TodoIdBlocks(3).take(engine, 1)
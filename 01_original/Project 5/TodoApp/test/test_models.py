@@ -0,0 +1,257 @@
+import importlib.util
+import io
+from pathlib import Path
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.pool import StaticPool
+from ..database import Base
+from ..models import Todos
+from ..routers.todos import todos_by_owner, todos_changed_since, filtered_todos, TodoFilters
+from ..search import search_todos
+from ..stats import todo_stats_by_owner, todo_counters_by_owner
+
+VERSIONS = Path(__file__).parent.parent / 'alembic' / 'versions'
+
+
+def explain(connection, statement, params) -> str:
+    compiled = statement.compile(connection)
+    values = compiled.construct_params(params)
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}',
+                                      tuple(values[name] for name in compiled.positiontup))
+    return ' '.join(row[-1] for row in rows)
+
+
+def memory_engine():
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def test_owner_list_uses_owner_index():
+    with memory_engine().connect() as connection:
+        plan = explain(connection, todos_by_owner, {'owner_id': 1})
+    assert 'USING INDEX ix_todos_owner_id' in plan
+    assert 'SCAN' not in plan
+
+
+def test_owner_complete_priority_uses_composite_index():
+    statement = select(Todos).filter(Todos.owner_id == 1).filter(Todos.complete == False)\
+        .order_by(Todos.priority)
+    with memory_engine().connect() as connection:
+        plan = explain(connection, statement, {})
+    assert 'USING INDEX ix_todos_owner_id_complete_priority' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+def test_priority_sort_uses_owner_priority_index():
+    with memory_engine().connect() as connection:
+        plan = explain(connection, filtered_todos(1, TodoFilters(sort='-priority')), {})
+    assert 'USING INDEX ix_todos_owner_id_priority_id' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+def load_migration(migration_file):
+    spec = importlib.util.spec_from_file_location(migration_file.removesuffix('.py'), VERSIONS / migration_file)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    return migration
+
+
+def offline_upgrade(migration_file, dialect_name) -> str:
+    output = io.StringIO()
+    context = MigrationContext.configure(dialect_name=dialect_name, opts={'as_sql': True, 'output_buffer': output})
+    with Operations.context(context):
+        load_migration(migration_file).upgrade()
+    return output.getvalue()
+
+
+@pytest.mark.parametrize('migration_file', ['5c3e8a9d2b71_add_owner_indexes_to_todos.py',
+                                            '9b1f4c7e3a20_add_owner_priority_index_to_todos.py'])
+def test_migration_creates_owner_indexes(migration_file):
+    migration = load_migration(migration_file)
+
+    engine = memory_engine()
+    with engine.begin() as connection:
+        for name in migration.INDEXES:
+            connection.execute(text(f'DROP INDEX {name}'))
+        with Operations.context(MigrationContext.configure(connection)):
+            migration.upgrade()
+
+    assert set(migration.INDEXES) <= {index['name'] for index in inspect(engine).get_indexes('todos')}
+
+
+def test_migration_creates_todo_id_sequence():
+    migration = load_migration('d2e7a4c9f1b8_create_todo_id_sequence.py')
+
+    engine = memory_engine()
+    with engine.begin() as connection:
+        connection.execute(text('DROP TABLE todo_id_sequence'))
+        connection.execute(Todos.__table__.insert().values(title='Existing', description='Before sharding',
+                                                           priority=1, complete=False, owner_id=1))
+        with Operations.context(MigrationContext.configure(connection)):
+            migration.upgrade()
+
+        assert connection.execute(text('SELECT id, next_id FROM todo_id_sequence')).all() == [(1, 2)]
+
+
+def test_migration_creates_todo_versions():
+    migration = load_migration('c4d81f0b6e52_create_todo_versions_table.py')
+
+    engine = memory_engine()
+    with engine.begin() as connection:
+        connection.execute(text('DROP TABLE todo_versions'))
+        with Operations.context(MigrationContext.configure(connection)):
+            migration.upgrade()
+
+    assert [column['name'] for column in inspect(engine).get_columns('todo_versions')] == ['owner_id', 'version']
+
+
+def test_search_uses_fts_index():
+    with memory_engine().connect() as connection:
+        plan = explain(connection, search_todos(1, 'milk'), {})
+    assert 'VIRTUAL TABLE INDEX' in plan
+
+
+def test_migration_creates_todo_search():
+    migration = load_migration('e7a2c9d4f318_add_todo_search_index.py')
+
+    engine = memory_engine()
+    with engine.begin() as connection:
+        for name in migration.SQLITE_TRIGGERS:
+            connection.execute(text(f'DROP TRIGGER {name}'))
+        connection.execute(text('DROP TABLE todos_fts'))
+        connection.execute(Todos.__table__.insert().values(title='Buy milk', description='Groceries',
+                                                           priority=1, complete=False, owner_id=1))
+        with Operations.context(MigrationContext.configure(connection)):
+            migration.upgrade()
+        connection.execute(Todos.__table__.insert().values(title='Walk dog', description='Exercise',
+                                                           priority=1, complete=False, owner_id=1))
+
+        assert connection.execute(search_todos(1, 'milk')).scalars().all() == [1]
+        assert connection.execute(search_todos(1, 'exercis')).scalars().all() == [2]
+        assert connection.execute(search_todos(2, 'milk')).scalars().all() == []
+
+
+def test_search_migration_skips_mysql():
+    assert offline_upgrade('e7a2c9d4f318_add_todo_search_index.py', 'mysql') == ''
+    assert 'fts5' in offline_upgrade('e7a2c9d4f318_add_todo_search_index.py', 'sqlite')
+
+
+def test_search_ddl_runs_only_when_todos_is_created():
+    engine = memory_engine()
+    with engine.begin() as connection:
+        connection.execute(text('DROP TRIGGER todos_fts_ai'))
+    Base.metadata.create_all(bind=engine)
+
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'todos_fts_ai'")).first() is None
+
+
+def test_search_is_scoped_by_owner():
+    with memory_engine().begin() as connection:
+        connection.execute(Todos.__table__.insert(), [
+            {'title': 'Buy milk', 'description': 'Groceries', 'priority': 1, 'complete': False, 'owner_id': 1},
+            {'title': 'Buy milk', 'description': 'Groceries', 'priority': 1, 'complete': False, 'owner_id': 2},
+        ])
+        match = connection.exec_driver_sql(
+            """SELECT rowid FROM todos_fts WHERE todos_fts MATCH 'owner_id : "2" AND milk'""").scalars().all()
+        assert match == [2]
+        assert connection.execute(search_todos(1, 'milk')).scalars().all() == [1]
+
+        connection.execute(Todos.__table__.update().where(Todos.id == 1).values(owner_id=2))
+        assert connection.execute(search_todos(1, 'milk')).scalars().all() == []
+        assert connection.execute(search_todos(2, 'milk')).scalars().all() == [1, 2]
+
+
+def test_migration_adds_change_tracking():
+    migration = load_migration('f3b5d8a1c6e9_add_todo_change_tracking.py')
+
+    engine = memory_engine()
+    with engine.begin() as connection:
+        connection.execute(text('DROP TABLE todo_tombstones'))
+        connection.execute(text('DROP INDEX ix_todos_owner_id_change_version'))
+        connection.execute(text('ALTER TABLE todos DROP COLUMN change_version'))
+        with Operations.context(MigrationContext.configure(connection)):
+            migration.upgrade()
+
+    assert 'change_version' in [column['name'] for column in inspect(engine).get_columns('todos')]
+    assert 'ix_todos_owner_id_change_version' in {index['name'] for index in inspect(engine).get_indexes('todos')}
+    assert inspect(engine).has_table('todo_tombstones')
+
+
+def test_migration_adds_user_profile_version():
+    migration = load_migration('7c1e5b9d3f24_add_user_profile_version.py')
+
+    engine = memory_engine()
+    with engine.begin() as connection:
+        connection.execute(text('ALTER TABLE users DROP COLUMN profile_version'))
+        with Operations.context(MigrationContext.configure(connection)):
+            migration.upgrade()
+
+    assert 'profile_version' in [column['name'] for column in inspect(engine).get_columns('users')]
+
+
+def test_changes_use_owner_change_version_index():
+    with memory_engine().connect() as connection:
+        plan = explain(connection, todos_changed_since, {'owner_id': 1, 'since': 5})
+    assert 'USING INDEX ix_todos_owner_id_change_version' in plan
+
+
+def test_stats_use_covering_index():
+    with memory_engine().connect() as connection:
+        plan = explain(connection, todo_stats_by_owner, {'owner_id': 1})
+    assert 'USING COVERING INDEX ix_todos_owner_id_complete_priority' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+def test_stats_counters_follow_writes():
+    engine = memory_engine()
+    todos = Todos.__table__
+    with engine.begin() as connection:
+        connection.execute(todos.insert(), [{'title': f'Todo {i}', 'description': 'Counted', 'priority': i % 3 + 1,
+                                             'complete': i % 2 == 0, 'owner_id': 1 + i % 2} for i in range(12)])
+        connection.execute(todos.update().where(todos.c.priority == 1).values(complete=True, priority=4))
+        connection.execute(todos.delete().where(todos.c.id.in_([2, 3, 5])))
+        connection.execute(todos.update().where(todos.c.id == 4).values(title='Renamed'))
+
+        for owner_id in (1, 2):
+            grouped = connection.execute(todo_stats_by_owner, {'owner_id': owner_id}).all()
+            counters = connection.execute(todo_counters_by_owner, {'owner_id': owner_id}).all()
+            assert sorted(counters) == sorted(grouped)
+
+
+def test_stats_triggers_are_created_only_with_todos():
+    engine = memory_engine()
+    with engine.begin() as connection:
+        connection.execute(text('DROP TRIGGER todo_stats_ai'))
+    Base.metadata.create_all(bind=engine)
+
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'todo_stats_ai'")).first() is None
+
+
+def test_stats_migration_uses_mysql_triggers():
+    sql = offline_upgrade('a8c3e6f2d417_add_todo_stats_counters.py', 'mysql')
+    assert sql.count('FOR EACH ROW') == 3
+    assert 'ON DUPLICATE KEY UPDATE' in sql
+    assert 'ON CONFLICT' not in sql
+
+
+def test_migration_creates_todo_stats():
+    migration = load_migration('a8c3e6f2d417_add_todo_stats_counters.py')
+
+    engine = memory_engine()
+    with engine.begin() as connection:
+        for name in migration.SQLITE_TRIGGERS:
+            connection.execute(text(f'DROP TRIGGER {name}'))
+        connection.execute(text('DROP TABLE todo_stats'))
+        connection.execute(Todos.__table__.insert().values(title='Before', description='Backfilled',
+                                                           priority=2, complete=False, owner_id=1))
+        with Operations.context(MigrationContext.configure(connection)):
+            migration.upgrade()
+        connection.execute(Todos.__table__.insert().values(title='After', description='Triggered',
+                                                           priority=2, complete=False, owner_id=1))
+
+        assert connection.execute(todo_counters_by_owner, {'owner_id': 1}).all() == [(False, 2, 2)]
@@ -1,4 +1,8 @@
-from ..routers.todos import get_db, get_current_user
+import json
+import pytest
+from ..routers import todos
+from ..routers.todos import get_current_user
+from ..database import get_db
 from fastapi import status
 from ..models import Todos
 from .utils import *
@@ -10,11 +14,113 @@ app.dependency_overrides[get_current_user] = override_get_current_user
 def test_read_all_authenticated(test_todo):
     response = client.get("/todos")
     assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {'todos': [{'complete': False, 'title': 'Learn to code!',
+                                          'description': 'Need to learn everyday!', 'id': 1,
+                                          'priority': 5, 'owner_id': 1}],
+                               'next_cursor': None}
+
+
+def test_read_all_unpaginated(test_todo):
+    response = client.get("/todos?all=true")
+    assert response.status_code == status.HTTP_200_OK
     assert response.json() == [{'complete': False, 'title': 'Learn to code!',
                                 'description': 'Need to learn everyday!', 'id': 1,
                                 'priority': 5, 'owner_id': 1}]
 
 
+def test_read_all_keyset_pages(test_todo):
+    db = TestingSessionLocal()
+    db.add_all([Todos(title=f'Todo {i}', description='Paged todo', priority=1,
+                      complete=False, owner_id=1) for i in range(4)])
+    db.add(Todos(title='Other owner', description='Not mine', priority=1, complete=False, owner_id=2))
+    db.commit()
+
+    first = client.get("/todos?limit=2").json()
+    assert [todo['id'] for todo in first['todos']] == [1, 2]
+    second = client.get(f"/todos?limit=2&cursor={first['next_cursor']}").json()
+    assert [todo['id'] for todo in second['todos']] == [3, 4]
+    last = client.get(f"/todos?limit=2&cursor={second['next_cursor']}").json()
+    assert [todo['id'] for todo in last['todos']] == [5]
+    assert last['next_cursor'] is None
+
+
+def add_filter_todos():
+    db = TestingSessionLocal()
+    db.add_all([
+        Todos(title='Buy milk', description='Groceries', priority=2, complete=True, owner_id=1),
+        Todos(title='Buy bread', description='Groceries', priority=4, complete=False, owner_id=1),
+        Todos(title='Walk_dog', description='Exercise', priority=1, complete=False, owner_id=1),
+        Todos(title='Buy eggs', description='Not mine', priority=3, complete=False, owner_id=2),
+    ])
+    db.commit()
+
+
+def test_read_all_filters(test_todo):
+    add_filter_todos()
+
+    response = client.get("/todos?complete=false&priority_min=2&priority_max=5")
+    assert [todo['title'] for todo in response.json()['todos']] == ['Learn to code!', 'Buy bread']
+
+    response = client.get("/todos?title_prefix=Buy")
+    assert [todo['title'] for todo in response.json()['todos']] == ['Buy milk', 'Buy bread']
+
+    response = client.get("/todos?title_prefix=Walk_&all=true")
+    assert [todo['title'] for todo in response.json()] == ['Walk_dog']
+
+
+def test_read_all_sorted_by_priority_pages(test_todo):
+    add_filter_todos()
+
+    first = client.get("/todos?sort=-priority&limit=2").json()
+    assert [todo['priority'] for todo in first['todos']] == [5, 4]
+    second = client.get(f"/todos?sort=-priority&limit=2&cursor={first['next_cursor']}").json()
+    assert [todo['priority'] for todo in second['todos']] == [2, 1]
+    assert second['next_cursor'] is None
+
+    response = client.get(f"/todos?sort=id&cursor={first['next_cursor']}")
+    assert response.status_code == 400
+
+
+def test_read_all_invalid_filters(test_todo):
+    response = client.get("/todos?priority_min=9")
+    assert response.status_code == 422
+    response = client.get("/todos?sort=title")
+    assert response.status_code == 422
+
+
+def test_read_all_fields(test_todo):
+    add_filter_todos()
+
+    response = client.get("/todos?fields=title,complete&limit=2")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['todos'] == [{'title': 'Learn to code!', 'complete': False},
+                                        {'title': 'Buy milk', 'complete': True}]
+    second = client.get(f"/todos?fields=title,complete&limit=2&cursor={response.json()['next_cursor']}")
+    assert [todo['title'] for todo in second.json()['todos']] == ['Buy bread', 'Walk_dog']
+
+    response = client.get("/todos?fields=title&sort=-priority&limit=1")
+    assert response.json()['todos'] == [{'title': 'Learn to code!'}]
+    second = client.get(f"/todos?fields=title&sort=-priority&cursor={response.json()['next_cursor']}")
+    assert [todo['title'] for todo in second.json()['todos']] == ['Buy bread', 'Buy milk', 'Walk_dog']
+
+    response = client.get("/todos?fields=id&all=true&complete=false")
+    assert response.json() == [{'id': 1}, {'id': 3}, {'id': 4}]
+
+
+def test_read_all_invalid_fields(test_todo):
+    response = client.get("/todos?fields=title,hashed_password")
+    assert response.status_code == 400
+    assert response.json() == {'detail': 'Invalid fields.'}
+    response = client.get("/todos?fields=,")
+    assert response.status_code == 400
+
+
+def test_read_all_invalid_cursor(test_todo):
+    response = client.get("/todos?cursor=not-a-cursor")
+    assert response.status_code == 400
+    assert response.json() == {'detail': 'Invalid cursor.'}
+
+
 def test_read_one_authenticated(test_todo):
     response = client.get("/todos/todo/1")
     assert response.status_code == status.HTTP_200_OK
@@ -23,6 +129,181 @@ def test_read_one_authenticated(test_todo):
                                 'priority': 5, 'owner_id': 1}
 
 
+def test_read_all_ndjson_stream(test_todo, monkeypatch):
+    monkeypatch.setattr(todos, 'TODO_STREAM_BATCH', 2)
+    add_filter_todos()
+
+    response = client.get("/todos", headers={'Accept': 'application/x-ndjson'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    assert 'etag' in response.headers
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [todo['title'] for todo in lines] == ['Learn to code!', 'Buy milk', 'Buy bread', 'Walk_dog']
+    assert lines[0] == {'id': 1, 'title': 'Learn to code!', 'description': 'Need to learn everyday!',
+                        'priority': 5, 'complete': False, 'owner_id': 1}
+
+    response = client.get("/todos?complete=false&fields=id,title&sort=-priority",
+                          headers={'Accept': 'application/x-ndjson'})
+    assert response.text == '{"id": 1, "title": "Learn to code!"}\n{"id": 3, "title": "Buy bread"}\n' \
+                            '{"id": 4, "title": "Walk_dog"}\n'
+
+
+def test_read_all_formats_have_their_own_etag(test_todo):
+    ndjson = {'Accept': 'application/x-ndjson'}
+    listing = client.get("/todos")
+    stream = client.get("/todos", headers=ndjson)
+    assert listing.headers['vary'] == stream.headers['vary'] == 'Accept'
+    assert listing.headers['etag'] != stream.headers['etag']
+
+    response = client.get("/todos", headers={**ndjson, 'If-None-Match': listing.headers['etag']})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    response = client.get("/todos", headers={**ndjson, 'If-None-Match': stream.headers['etag']})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers['vary'] == 'Accept'
+
+
+def test_read_changes(test_todo):
+    snapshot = client.get("/todos/changes").json()
+    assert [todo['id'] for todo in snapshot['todos']] == [1]
+    assert snapshot['deleted'] == []
+
+    client.post('/todos/bulk', json=[{'title': f'Synced {i}', 'description': 'Offline', 'priority': 2,
+                                      'complete': False} for i in range(3)])
+    client.patch('/todos/bulk', json={'ids': [1], 'changes': {'complete': True}})
+    client.delete('/todos/todo/3')
+    changes = client.get(f"/todos/changes?since={snapshot['version']}").json()
+    assert [(todo['id'], todo['complete']) for todo in changes['todos']] == [(2, False), (4, False), (1, True)]
+    assert changes['deleted'] == [3]
+
+    client.request('DELETE', '/todos/bulk', json={'ids': [4]})
+    latest = client.get(f"/todos/changes?since={changes['version']}").json()
+    assert latest == {'version': changes['version'] + 1, 'todos': [], 'deleted': [4]}
+    assert client.get(f"/todos/changes?since={latest['version']}").json()['todos'] == []
+
+
+def test_read_changes_invalid_token(test_todo):
+    response = client.get("/todos/changes?since=1000")
+    assert response.status_code == 400
+    assert response.json() == {'detail': 'Invalid sync token.'}
+
+
+@pytest.mark.parametrize('counters', [False, True])
+def test_read_stats(test_todo, monkeypatch, counters):
+    monkeypatch.setattr(todos, 'TODO_STATS_COUNTERS', counters)
+    add_filter_todos()
+    client.patch('/todos/bulk', json={'ids': [4], 'changes': {'priority': 2}})
+
+    response = client.get("/todos/stats")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {'total': 4, 'open': 3, 'completed': 1, 'by_priority': {'2': 2, '4': 1, '5': 1}}
+
+
+def test_search(test_todo):
+    add_filter_todos()
+
+    response = client.get("/todos/search?q=buy")
+    assert response.status_code == status.HTTP_200_OK
+    assert sorted(todo['title'] for todo in response.json()) == ['Buy bread', 'Buy milk']
+
+    response = client.get("/todos/search?q=groceries milk&fields=id,title")
+    assert response.json() == [{'id': 2, 'title': 'Buy milk'}]
+
+    response = client.get("/todos/search?q=learning")
+    assert [todo['id'] for todo in response.json()] == [1]
+
+
+def test_search_follows_writes(test_todo):
+    client.put('/todos/todo/1', json={'title': 'Practise piano', 'description': 'Scales and chords',
+                                      'priority': 5, 'complete': False})
+    assert client.get("/todos/search?q=learn").json() == []
+    assert [todo['id'] for todo in client.get("/todos/search?q=piano").json()] == [1]
+
+    client.delete('/todos/todo/1')
+    assert client.get("/todos/search?q=piano").json() == []
+
+
+def test_search_ignores_query_syntax(test_todo):
+    response = client.get('/todos/search?q="learn*(:')
+    assert response.status_code == status.HTTP_200_OK
+    assert [todo['id'] for todo in response.json()] == [1]
+    assert client.get('/todos/search?q=***').json() == []
+
+
+def test_search_unavailable_without_index(test_todo, monkeypatch):
+    monkeypatch.setattr(todos, 'SEARCH_BACKEND', 'mysql')
+    response = client.get("/todos/search?q=learn")
+    assert response.status_code == status.HTTP_501_NOT_IMPLEMENTED
+    assert response.json() == {'detail': 'Search is not available on this database.'}
+
+
+def test_read_all_etag(test_todo):
+    response = client.get("/todos")
+    etag = response.headers['etag']
+
+    with count_statements() as statements:
+        response = client.get("/todos", headers={'If-None-Match': etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers['etag'] == etag
+    assert len(statements) == 1 and 'todo_versions' in statements[0]
+
+    response = client.get("/todos/todo/1", headers={'If-None-Match': etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def test_writes_change_etag(test_todo):
+    etag = client.get("/todos").headers['etag']
+
+    client.post('/todos/todo', json={'title': 'New Todo!', 'description': 'New todo description',
+                                     'priority': 5, 'complete': False})
+    response = client.get("/todos", headers={'If-None-Match': etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['etag'] != etag
+    etag = response.headers['etag']
+
+    client.delete('/todos/todo/2')
+    client.patch('/todos/bulk', json={'ids': [999], 'changes': {'complete': True}})
+    response = client.get("/todos", headers={'If-None-Match': etag})
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers['etag']
+
+    client.patch('/todos/bulk', json={'ids': [999], 'changes': {'complete': True}})
+    response = client.get("/todos", headers={'If-None-Match': etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def test_first_write_upserts_version(test_todo):
+    with count_statements() as statements:
+        for i in range(2):
+            client.post('/todos/todo', json={'title': f'Upsert {i}', 'description': 'Versioned',
+                                             'priority': 1, 'complete': False})
+    upserts = [statement for statement in statements if statement.startswith('INSERT INTO todo_versions')]
+    assert len(upserts) == 2 and all('ON CONFLICT' in statement for statement in upserts)
+    assert client.get('/todos/changes').json()['version'] == 2
+
+
+def test_writes_without_returning(test_todo, monkeypatch):
+    for name in ('insert_returning', 'update_returning', 'delete_returning'):
+        monkeypatch.setattr(async_engine.sync_engine.dialect, name, False)
+
+    with count_statements() as statements:
+        assert client.patch('/todos/todo/1', json={'complete': True}).status_code == 204
+        assert client.patch('/todos/todo/999', json={'complete': True}).status_code == 404
+        assert client.delete('/todos/todo/999').status_code == 404
+        assert client.delete('/todos/todo/1').status_code == 204
+    assert not any('RETURNING' in statement for statement in statements)
+    assert client.get('/todos/changes?since=0').json() == {'version': 2, 'todos': [], 'deleted': [1]}
+
+
+def test_read_one_fields(test_todo):
+    response = client.get("/todos/todo/1?fields=title,priority")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {'title': 'Learn to code!', 'priority': 5}
+
+    response = client.get("/todos/todo/999?fields=title")
+    assert response.status_code == 404
+
+
 def test_read_one_authenticated_not_found():
     response = client.get("/todos/todo/999")
     assert response.status_code == 404
@@ -48,6 +329,123 @@ def test_create_todo(test_todo):
     assert model.complete == request_data.get('complete')
 
 
+def test_create_todos_bulk(test_todo):
+    request_data = [{'title': f'Bulk todo {i}', 'description': 'Imported', 'priority': 3, 'complete': False}
+                    for i in range(3)]
+
+    response = client.post('/todos/bulk', json=request_data)
+    assert response.status_code == 201
+    assert response.json() == {'ids': [2, 3, 4], 'errors': []}
+
+    db = TestingSessionLocal()
+    assert [db.get(Todos, todo_id).title for todo_id in response.json()['ids']] == \
+        ['Bulk todo 0', 'Bulk todo 1', 'Bulk todo 2']
+
+
+def test_create_todos_bulk_partial_failure(test_todo):
+    request_data = [
+        {'title': 'Valid todo', 'description': 'Imported', 'priority': 3, 'complete': False},
+        {'title': 'No', 'description': 'Imported', 'priority': 3, 'complete': False},
+        'not a todo',
+    ]
+
+    response = client.post('/todos/bulk', json=request_data)
+    assert response.status_code == 201
+    assert response.json()['ids'] == [2]
+    assert [error['index'] for error in response.json()['errors']] == [1, 2]
+    assert response.json()['errors'][0]['errors'][0]['loc'] == ['title']
+
+
+def test_create_todos_bulk_limit(test_todo, monkeypatch):
+    monkeypatch.setattr(todos, 'TODO_BULK_MAX', 2)
+    request_data = [{'title': 'Bulk todo', 'description': 'Imported', 'priority': 3, 'complete': False}] * 3
+
+    response = client.post('/todos/bulk', json=request_data)
+    assert response.status_code == 413
+    db = TestingSessionLocal()
+    assert db.query(Todos).count() == 1
+
+
+def test_update_todos_bulk_by_ids(test_todo):
+    add_filter_todos()
+
+    with count_statements() as statements:
+        response = client.patch('/todos/bulk', json={'ids': [1, 3, 5], 'changes': {'complete': True}})
+    assert response.status_code == 200
+    assert response.json() == {'updated': 2}
+    assert [statement.split()[0] for statement in todo_statements(statements)] == ['UPDATE']
+
+    db = TestingSessionLocal()
+    assert [todo.id for todo in db.query(Todos).filter(Todos.complete.is_(True)).order_by(Todos.id)] == [1, 2, 3]
+    assert db.query(Todos).filter(Todos.id == 5).first().complete is False
+
+
+def test_update_todos_bulk_by_filter(test_todo):
+    add_filter_todos()
+
+    response = client.patch('/todos/bulk', json={'filters': {'priority_max': 2},
+                                                 'changes': {'complete': True, 'priority': 3}})
+    assert response.json() == {'updated': 2}
+
+    db = TestingSessionLocal()
+    assert [(todo.title, todo.priority, todo.complete) for todo in
+            db.query(Todos).filter(Todos.priority == 3).order_by(Todos.id)] == \
+        [('Buy milk', 3, True), ('Walk_dog', 3, True), ('Buy eggs', 3, False)]
+
+
+def test_update_todos_bulk_invalid(test_todo):
+    response = client.patch('/todos/bulk', json={'changes': {'complete': True}})
+    assert response.status_code == 422
+    response = client.patch('/todos/bulk', json={'ids': [1], 'filters': {}, 'changes': {'complete': True}})
+    assert response.status_code == 422
+    for filters in ({}, {'sort': '-priority'}):
+        response = client.patch('/todos/bulk', json={'filters': filters, 'changes': {'complete': True}})
+        assert response.status_code == 422
+        assert client.request('DELETE', '/todos/bulk', json={'filters': filters}).status_code == 422
+    assert client.get('/todos/todo/1').json()['complete'] is False
+    response = client.patch('/todos/bulk', json={'ids': [1], 'changes': {}})
+    assert response.status_code == 422
+    assert response.json()['detail'][0]['loc'] == ['body', 'changes']
+
+
+def test_delete_todos_bulk_by_ids(test_todo):
+    add_filter_todos()
+
+    with count_statements() as statements:
+        response = client.request('DELETE', '/todos/bulk', json={'ids': [2, 3, 5]})
+    assert response.status_code == 200
+    assert response.json() == {'deleted': 2}
+    select_ids, delete_ids = todo_statements(statements)
+    assert select_ids.startswith('SELECT todos.id') and delete_ids.startswith('DELETE FROM todos')
+    assert 'SELECT' not in delete_ids
+
+    db = TestingSessionLocal()
+    assert [todo.id for todo in db.query(Todos).order_by(Todos.id)] == [1, 4, 5]
+
+
+def test_delete_todos_bulk_by_filter_in_chunks(test_todo, monkeypatch):
+    monkeypatch.setattr(todos, 'TODO_DELETE_CHUNK', 2)
+    add_filter_todos()
+
+    with count_statements() as statements:
+        response = client.request('DELETE', '/todos/bulk', json={'filters': {'priority_max': 4}})
+    assert response.json() == {'deleted': 3}
+    assert len([statement for statement in statements if statement.startswith('DELETE')]) == 2
+
+    db = TestingSessionLocal()
+    assert [todo.title for todo in db.query(Todos).order_by(Todos.id)] == ['Learn to code!', 'Buy eggs']
+
+
+def test_clear_completed(test_todo):
+    add_filter_todos()
+
+    response = client.delete('/todos/completed')
+    assert response.json() == {'deleted': 1}
+    db = TestingSessionLocal()
+    assert db.query(Todos).filter(Todos.complete.is_(True)).count() == 0
+    assert db.query(Todos).count() == 4
+
+
 def test_update_todo(test_todo):
     request_data={
         'title':'Change the title of the todo already saved!',
@@ -56,8 +454,11 @@ def test_update_todo(test_todo):
         'complete': False,
     }
 
-    response = client.put('/todos/todo/1', json=request_data)
+    with count_statements() as statements:
+        response = client.put('/todos/todo/1', json=request_data)
     assert response.status_code == 204
+    [statement] = todo_statements(statements)
+    assert statement.startswith('UPDATE todos') and 'RETURNING' in statement
     db = TestingSessionLocal()
     model = db.query(Todos).filter(Todos.id == 1).first()
     assert model.title == 'Change the title of the todo already saved!'
@@ -76,9 +477,84 @@ def test_update_todo_not_found(test_todo):
     assert response.json() == {'detail': 'Todo not found.'}
 
 
+def test_patch_todo(test_todo):
+    with count_statements() as statements:
+        response = client.patch('/todos/todo/1', json={'complete': True})
+    assert response.status_code == 204
+    [statement] = todo_statements(statements)
+    assert statement.startswith('UPDATE todos SET complete=?, change_version=?')
+    db = TestingSessionLocal()
+    model = db.query(Todos).filter(Todos.id == 1).first()
+    assert model.complete is True
+    assert model.title == 'Learn to code!'
+
+
+def test_patch_todo_invalid(test_todo):
+    response = client.patch('/todos/todo/999', json={'complete': True})
+    assert response.status_code == 404
+    assert response.json() == {'detail': 'Todo not found.'}
+    assert client.patch('/todos/todo/1', json={}).status_code == 422
+    response = client.patch('/todos/todo/1', json={'title': None})
+    assert response.status_code == 422
+    assert response.json()['detail'][0]['msg'] == 'Value error, No changes given.'
+    assert client.patch('/todos/todo/1', json={'priority': 9}).status_code == 422
+
+
+def test_batch_runs_in_one_transaction(test_todo):
+    operations = [
+        {'op': 'create', 'todo': {'title': 'Batched', 'description': 'Made in a batch', 'priority': 2,
+                                  'complete': False}},
+        {'op': 'update', 'id': 1, 'changes': {'complete': True}},
+        {'op': 'delete', 'id': 1},
+    ]
+    with count_statements() as statements:
+        response = client.post('/todos/batch', json={'operations': operations})
+    assert response.status_code == 200
+    assert response.json() == {'committed': True, 'results': [
+        {'index': 0, 'status': 201, 'id': 2}, {'index': 1, 'status': 204, 'id': 1},
+        {'index': 2, 'status': 204, 'id': 1}]}
+    assert [statement.split()[0] for statement in todo_statements(statements)] == ['INSERT', 'UPDATE', 'DELETE']
+
+    db = TestingSessionLocal()
+    assert [todo.title for todo in db.query(Todos)] == ['Batched']
+    assert client.get('/todos/changes?since=0').json()['deleted'] == [1]
+
+
+def test_batch_atomic_rolls_back(test_todo):
+    operations = [{'op': 'update', 'id': 1, 'changes': {'title': 'Rolled back'}},
+                  {'op': 'delete', 'id': 999}]
+    response = client.post('/todos/batch', json={'operations': operations})
+    assert response.status_code == 409
+    assert response.json()['committed'] is False
+    assert response.json()['results'][-1] == {'index': 1, 'status': 404, 'detail': 'Todo not found.'}
+
+    response = client.post('/todos/batch', json={'operations': [operations[0], {'op': 'update', 'id': 1}]})
+    assert response.status_code == 422
+    assert [result['index'] for result in response.json()['results']] == [1]
+
+    db = TestingSessionLocal()
+    assert db.query(Todos).filter(Todos.id == 1).first().title == 'Learn to code!'
+
+
+def test_batch_best_effort_keeps_successes(test_todo):
+    operations = [{'op': 'delete', 'id': 999},
+                  {'op': 'update', 'id': 1, 'changes': {'title': 'Kept'}},
+                  {'op': 'archive', 'id': 1}]
+    response = client.post('/todos/batch', json={'mode': 'best_effort', 'operations': operations})
+    assert response.status_code == 200
+    assert response.json()['committed'] is True
+    assert [result['status'] for result in response.json()['results']] == [404, 204, 422]
+
+    db = TestingSessionLocal()
+    assert db.query(Todos).filter(Todos.id == 1).first().title == 'Kept'
+
+
 def test_delete_todo(test_todo):
-    response = client.delete('/todos/todo/1')
+    with count_statements() as statements:
+        response = client.delete('/todos/todo/1')
     assert response.status_code == 204
+    [statement] = todo_statements(statements)
+    assert statement.startswith('DELETE FROM todos') and 'RETURNING' in statement
     db = TestingSessionLocal()
     model = db.query(Todos).filter(Todos.id == 1).first()
     assert model is None
@@ -1,5 +1,6 @@
 from .utils import *
-from ..routers.users import get_db, get_current_user
+from ..routers.users import get_current_user
+from ..database import get_db
 from fastapi import status
 
 app.dependency_overrides[get_db] = override_get_db
@@ -14,6 +15,14 @@ def test_return_user(test_user):
     assert response.json()['last_name'] == 'Roby'
     assert response.json()['role'] == 'admin'
     assert response.json()['phone_number'] == '(111)-111-1111'
+    assert 'hashed_password' not in response.json()
+
+
+def test_return_user_reads_one_row_without_cache(test_user):
+    with count_statements() as statements:
+        assert client.get("/user").status_code == status.HTTP_200_OK
+    [statement] = statements
+    assert statement.startswith('SELECT users.id')
 
 
 def test_change_password_success(test_user):
@@ -30,8 +39,14 @@ def test_change_password_invalid_current_password(test_user):
 
 
 def test_change_phone_number_success(test_user):
-    response = client.put("/user/phonenumber/2222222222")
+    with count_statements() as statements:
+        response = client.put("/user/phonenumber/2222222222")
     assert response.status_code == status.HTTP_204_NO_CONTENT
+    [statement] = todo_statements(statements)
+    assert statement.startswith('UPDATE users') and 'RETURNING' in statement
+
+    db = TestingSessionLocal()
+    assert db.query(Users).filter(Users.id == test_user.id).first().phone_number == '2222222222'
 
 
 
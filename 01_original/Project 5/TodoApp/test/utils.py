@@ -1,6 +1,8 @@
-from sqlalchemy import create_engine, text
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.pool import StaticPool
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from ..database import Base
 from ..main import app
 from fastapi.testclient import TestClient
@@ -9,6 +11,7 @@ from ..models import Todos, Users
 from ..routers.auth import bcrypt_context
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./testdb.db"
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./testdb.db"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
@@ -18,14 +21,36 @@ engine = create_engine(
 
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass = StaticPool,
+)
+
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 Base.metadata.create_all(bind=engine)
 
-def override_get_db():
-    db = TestingSessionLocal()
-    try:
+async def override_get_db():
+    async with TestingAsyncSessionLocal() as db:
         yield db
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, 'before_cursor_execute', record)
+    try:
+        yield statements
     finally:
-        db.close()
+        event.remove(async_engine.sync_engine, 'before_cursor_execute', record)
+
+def todo_statements(statements):
+    return [statement for statement in statements
+            if 'todo_versions' not in statement and 'todo_tombstones' not in statement]
 
 def override_get_current_user():
     return {'username': 'codingwithrobytest', 'id': 1, 'user_role': 'admin'}
@@ -48,6 +73,8 @@ def test_todo():
     yield todo
     with engine.connect() as connection:
         connection.execute(text("DELETE FROM todos;"))
+        connection.execute(text("DELETE FROM todo_versions;"))
+        connection.execute(text("DELETE FROM todo_tombstones;"))
         connection.commit()
 
 
@@ -0,0 +1,53 @@
+from sqlalchemy import select, bindparam
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from .models import TodoVersions, TodoTombstones
+
+# Every write to a user's todos bumps their version, so reads can answer If-None-Match from one row.
+todo_version_by_owner = select(TodoVersions.version).filter(TodoVersions.owner_id == bindparam('owner_id'))
+# An upsert creates the row on a user's first write, so two concurrent first writes cannot collide.
+# Core statements on the table: ORM bulk inserts cannot run in a ShardedSession.
+todo_versions = TodoVersions.__table__
+bump_todo_version_upserts = {
+    'sqlite': sqlite.insert(todo_versions).on_conflict_do_update(
+        index_elements=[todo_versions.c.owner_id], set_={'version': todo_versions.c.version + 1}),
+    'postgresql': postgresql.insert(todo_versions).on_conflict_do_update(
+        index_elements=[todo_versions.c.owner_id], set_={'version': todo_versions.c.version + 1}),
+    'mysql': mysql.insert(todo_versions).on_duplicate_key_update(version=todo_versions.c.version + 1),
+}
+tombstones_since = select(TodoTombstones.todo_id).filter(TodoTombstones.owner_id == bindparam('owner_id'))\
+    .filter(TodoTombstones.change_version > bindparam('since'))
+
+
+async def get_todo_version(db, owner_id: int) -> int:
+    return await db.scalar(todo_version_by_owner, {'owner_id': owner_id}) or 0
+
+
+async def bump_todo_version(db, owner_id: int) -> int:
+    bind_arguments = {'mapper': TodoVersions.__mapper__}
+    dialect = db.get_bind(**bind_arguments).dialect
+    upsert = bump_todo_version_upserts[dialect.name]
+    params = {'owner_id': owner_id, 'version': 1}
+    if dialect.insert_returning:
+        return await db.scalar(upsert.returning(todo_versions.c.version), params, bind_arguments=bind_arguments)
+    # MySQL has no RETURNING; the upsert holds the row lock, so reading it back is still this bump.
+    await db.execute(upsert, params, bind_arguments=bind_arguments)
+    return await get_todo_version(db, owner_id)
+
+
+def add_tombstones(db, owner_id: int, todo_ids: list[int], version: int):
+    db.add_all([TodoTombstones(todo_id=todo_id, owner_id=owner_id, change_version=version) for todo_id in todo_ids])
+
+
+async def get_tombstones(db, owner_id: int, since: int) -> list[int]:
+    return list((await db.scalars(tombstones_since, {'owner_id': owner_id, 'since': since})).all())
+
+
+def todo_etag(owner_id: int, version: int, variant: str = '') -> str:
+    return f'W/"{owner_id}.{version}{variant}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in tags or etag.removeprefix('W/') in tags